@@ -1,9 +1,57 @@
 # Backtest Object File
 
 # Imports
+import numpy as numpy
 import pandas as pandas
 import signals as signals
+import rules as rules
 import indicators as indicators
+import kernels as kernels
+import sessions as sessions
+import profiling as profiling
+import ledger as ledger
+
+# Compact column types of a lean DataFrame. 'TimeBarStart' becomes an HHMM
+# integer like 'query.readArrays' and the prices that only describe a bar
+# are float32, while 'VolumeWeightPrice', which trades and indicators are
+# computed from, stays float64 so results match the full DataFrame
+LEAN_DTYPES = {'Date': numpy.int32, 'TimeBarStart': numpy.int16, 'FirstTradePrice': numpy.float32,
+               'HighTradePrice': numpy.float32, 'LowTradePrice': numpy.float32,
+               'LastTradePrice': numpy.float32, 'VolumeWeightPrice': numpy.float64,
+               'Volume': numpy.int64, 'TotalTrades': numpy.int32}
+
+
+def leanFrame(data, columns, keep=None):
+    """
+    Builds a memory lean DataFrame. 'Ticker' is dropped, since a backtest
+    covers one ticker, and every other column is converted straight to its
+    'LEAN_DTYPES' type without building an object DataFrame first. 'Volume'
+    is stored as int32 when every value fits, and an integer column holding
+    NULL values is stored as float64 with NaN like the default DataFrame
+    :param data: Query result or dictionary of column arrays
+    :param columns: List of column labels of the query result
+    :param keep: Optional list of the column labels to keep (defaults to every column but 'Ticker')
+    :return: Pandas DataFrame
+    """
+    keep = [column for column in columns if column != 'Ticker'] if keep is None else list(keep)
+    frame = {}
+    for column in keep:
+        if isinstance(data, dict):
+            values = data[column]
+        else:
+            index = columns.index(column)
+            values = [row[index] for row in data]
+        if column == 'TimeBarStart' and getattr(values, 'dtype', numpy.dtype(object)).kind not in 'iu':
+            values = sessions.toHHMM(sessions.minutesOfDay(values))
+        try:
+            values = numpy.asarray(values, dtype=LEAN_DTYPES.get(column))
+        except TypeError:
+            values = numpy.asarray(values, dtype=numpy.float64)
+        if column == 'Volume' and len(values) and values.max() <= numpy.iinfo(numpy.int32).max:
+            values = values.astype(numpy.int32)
+        frame[column] = values
+    return pandas.DataFrame(frame, columns=keep)
+
 
 # Backtest Class
 class Backtest:
@@ -15,7 +63,8 @@ class Backtest:
     financial thesis on historical data
     """
     # Class constructor
-    def __init__(self, query, columns, capital, stop_loss, percentage, risk):
+    def __init__(self, query, columns, capital, stop_loss, percentage, risk, confirmation=70, key=None, profile=None,
+                 timeframe=None, lean=False, keep=None):
         """
         Constructs a backtest object to run the class's 'fillTable' and
         'iterate' functions
@@ -27,12 +76,31 @@ class Backtest:
         :param percentage: float value that is the
         Maximum amount of capital used on any given trade
         :param risk: Waiting period time until position is entered after signal confirmation
+        :param confirmation: Number of bars the entrance signal must be met
+        before a position is entered (70)
+        :param key: Optional (ticker, start, end) tuple identifying the
+        queried data, used to look up indicator columns in a cache
+        :param profile: Optional 'profiling.py' Profiler that times the stages
+        :param timeframe: Optional 'timeframes.py' label (e.g. '15m') of the
+        bars in the query, None for one minute bars
+        :param lean: Boolean value for whether or not to build the DataFrame
+        with the compact 'LEAN_DTYPES' column types (see 'leanFrame')
+        :param keep: Optional list of the column labels kept by a lean DataFrame
         """
+        if confirmation < 0:
+            raise ValueError("Negative confirmation period: " + str(confirmation))
 
         # Instance Variables
+        self.profile = profile or profiling.DISABLED
         self.data = query
-        self.df = pandas.DataFrame(data=self.data, columns=columns)
+        with self.profile.stage('DataFrame'):
+            if lean:
+                self.df = leanFrame(self.data, columns, keep)
+            else:
+                self.df = pandas.DataFrame(data=self.data, columns=columns)
+        self.profile.count('rows', len(self.df))
         self.capital = capital
+        self.starting_capital = capital
         self.roi = 0.00
         self.inPosition = False
         self.percentage = percentage
@@ -41,18 +109,25 @@ class Backtest:
         self.entrance = 0.00
         self.current = 0.00
         self.risk = risk
+        self.confirmation = confirmation
         self.shares = 0
         self.profit = 0.00
         self.total_profit = 0.00
         self.won = 0
         self.lost = 0
         self.trades = 0
+        self.costs = 0.00
         self.sma_fast = None
         self.sma_slow = None
         self.ema = None
         self.rsi = None
+        self.ledger = ledger.TradeLedger()
+        self.key = key
+        self.timeframe = timeframe
+        self.session = None
 
-    def fillTable(self, sma_fast, sma_slow, ema, macd_fast, macd_slow, rsi_period):
+    @profiling.staged('indicators')
+    def fillTable(self, sma_fast, sma_slow, ema, macd_fast, macd_slow, rsi_period, cache=None, engine='kernels'):
         """
         The parameters passed into this function create new columns in the Pandas
         DataFrame 'self.df' to be utilized by the 'signals.py' module. Additionally,
@@ -67,6 +142,10 @@ class Backtest:
         :param macd_fast: Fast moving average convergence divergence value (13)
         :param macd_slow: Slow moving average convergence divergence value (26)
         :param rsi_period: Relative strength index value (14)
+        :param cache: Optional 'cache.py' IndicatorCache, used when the
+        backtest was constructed with a key
+        :param engine: 'kernels' to compute every column together with the
+        'kernels.py' module, or 'pandas' for the 'indicators.py' functions
         :return: Updated Pandas DataFrame
         """
         # Name the DataFrame Columns Appropriately
@@ -74,12 +153,56 @@ class Backtest:
         self.sma_slow = "SMA"+str(sma_slow)
         self.ema_fast = "EMA" + str(ema)
 
+        if engine == 'kernels':
+            # Columns not found in the cache are computed together on first use
+            computed = {}
+
+            def fused(column, name):
+                def compute():
+                    if not computed:
+                        computed.update(kernels.compute(self.df['VolumeWeightPrice'].to_numpy(dtype=float),
+                                                        (sma_fast, sma_slow), (ema,), ((macd_fast, macd_slow),),
+                                                        (rsi_period,)))
+                    self.df[column] = computed[name]
+                return compute
+
+            self.fillColumn(cache, self.sma_fast, (sma_fast,), fused(self.sma_fast, self.sma_fast))
+            self.fillColumn(cache, self.sma_slow, (sma_slow,), fused(self.sma_slow, self.sma_slow))
+            self.fillColumn(cache, self.ema_fast, (ema,), fused(self.ema_fast, self.ema_fast))
+            self.fillColumn(cache, 'MACD', (macd_fast, macd_slow),
+                            fused('MACD', 'MACD' + str(macd_fast) + '_' + str(macd_slow)))
+            self.fillColumn(cache, 'RSI', (rsi_period,), fused('RSI', 'RSI' + str(rsi_period)))
+            return
+
         # Fill the Pandas DataFrame columns using 'signals.py' module functions
-        indicators.simpleMA(self.df, sma_fast)
-        indicators.simpleMA(self.df, sma_slow)
-        indicators.exponentialMA(self.df, ema)
-        indicators.movingAverageConvergence(self.df, macd_fast, macd_slow)
-        indicators.rsi(self.df, rsi_period)
+        self.fillColumn(cache, self.sma_fast, (sma_fast,), lambda: indicators.simpleMA(self.df, sma_fast))
+        self.fillColumn(cache, self.sma_slow, (sma_slow,), lambda: indicators.simpleMA(self.df, sma_slow))
+        self.fillColumn(cache, self.ema_fast, (ema,), lambda: indicators.exponentialMA(self.df, ema))
+        self.fillColumn(cache, 'MACD', (macd_fast, macd_slow),
+                        lambda: indicators.movingAverageConvergence(self.df, macd_fast, macd_slow))
+        self.fillColumn(cache, 'RSI', (rsi_period,), lambda: indicators.rsi(self.df, rsi_period))
+
+    def fillColumn(self, cache, column, periods, compute):
+        """
+        Fills one indicator column from the cache, or computes
+        it and adds it to the cache
+        :param cache: 'cache.py' IndicatorCache or None
+        :param column: Indicator column label
+        :param periods: Tuple of the indicator periods
+        :param compute: Function that adds the column to 'self.df'
+        :return:
+        """
+        if cache is None or self.key is None:
+            compute()
+            return
+
+        key = self.key + (self.timeframe, self.session, len(self.df), 'VolumeWeightPrice', column) + periods
+        values = cache.get(key)
+        if values is None:
+            compute()
+            cache.put(key, self.df[column].to_numpy(copy=True))
+        else:
+            self.df[column] = values
 
     def takePosition(self, column):
         """
@@ -123,9 +246,9 @@ class Backtest:
         self.roi = 0.00
         self.shares = 0
         self.entrance = 0.00
-        self.trades += 1
         self.profit = 0.00
 
+    @profiling.staged('iterate')
     def iterate(self):
         """
         This function iterates through the entirety of a Pandas
@@ -134,15 +257,17 @@ class Backtest:
         :return: Total profit for specific time period and ticker passed by user
         """
         exit_price = None
+        entry_index = None
         period = 0
         # Loop through the rows and columns of the Pandas DF
-        for row, column in self.df.iterrows():
+        for index, (row, column) in enumerate(self.df.iterrows()):
             # Check if technical indicator signals have identified an entrance position
             if signals.positionEntrance(column[self.sma_slow], column[self.sma_fast], column['MACD'], column['RSI']):
                 period += 1
                 # If signals have been confirmed and currently not in a position, enter the position
-                if not self.inPosition and period >= 70:
+                if not self.inPosition and period >= self.confirmation:
                     self.takePosition(column)
+                    entry_index = index
                     # Create stop loss value
                     exit_price = column['VolumeWeightPrice'] * (1.0 - self.stop_loss)
                 if self.inPosition:
@@ -152,25 +277,140 @@ class Backtest:
 
             # Check if technical indicator signals have identified an exit position
             if self.inPosition:
-                if exit_price >= column['VolumeWeightPrice'] or signals.positionExit(column['MACD'], column['RSI']):
+                stopped = exit_price >= column['VolumeWeightPrice']
+                if stopped or signals.positionExit(column['MACD'], column['RSI']):
                     # Calculate ROI and profit as well as leave current position
                     self.current = column['VolumeWeightPrice']
                     self.roi = self.current * self.shares
+                    self.ledger.append(entry_index, index, self.entrance, self.current, self.shares,
+                                       ledger.STOP if stopped else ledger.SIGNAL)
                     self.leavePosition(column)
                     period = 0
 
         # Round total profit to two decimal places
         self.total_profit = round(self.total_profit, 2)
+        self.profile.count('trades', len(self.ledger))
+
+    @profiling.staged('iterate')
+    def vectorIterate(self, start=0, stop=None, entry_rule=None, exit_rule=None):
+        """
+        Vectorized engine mode of the 'iterate' function. The entrance and
+        exit signals are evaluated for the whole DataFrame at once with NumPy,
+        and only the stateful part (confirmation counter, stop loss and
+        position accounting) is resolved in a single pass over the trades.
+        Produces the same results and ledger as 'iterate'
+        :param start: First row to trade on (0)
+        :param stop: Row after the last row to trade on (defaults to the end),
+        the indicators before 'start' still come from the full DataFrame
+        :param entry_rule: Optional 'rules.py' rule or rule text replacing the
+        entrance signal of 'signals.py' (see 'rules.ENTRANCE')
+        :param exit_rule: Optional 'rules.py' rule or rule text replacing the
+        exit signal of 'signals.py' (see 'rules.EXIT')
+        :return: Total profit for specific time period and ticker passed by user
+        """
+        rows = slice(start, stop)
+        price = self.df['VolumeWeightPrice'].to_numpy(dtype=float)[rows]
+        if entry_rule is None and exit_rule is None:
+            entrance = signals.entranceMask(self.df[self.sma_slow].to_numpy(dtype=float)[rows],
+                                            self.df[self.sma_fast].to_numpy(dtype=float)[rows],
+                                            self.df['MACD'].to_numpy(dtype=float)[rows],
+                                            self.df['RSI'].to_numpy(dtype=float)[rows])
+            exits = signals.exitMask(self.df['MACD'].to_numpy(dtype=float)[rows],
+                                     self.df['RSI'].to_numpy(dtype=float)[rows])
+        else:
+            # Evaluate the rules once over the rows, with aliases of the indicator columns
+            columns = rules.Columns(self.df, {'SMA_FAST': self.sma_fast, 'SMA_SLOW': self.sma_slow,
+                                              'EMA': self.ema_fast}, rows)
+            # Rules of constants alone give one value for every bar
+            entrance = numpy.broadcast_to(rules.makeRule(entry_rule or rules.ENTRANCE).mask(columns), len(price))
+            exits = numpy.broadcast_to(rules.makeRule(exit_rule or rules.EXIT).mask(columns), len(price))
+        size = len(price)
+
+        # Running count of entrance signals, the confirmation period is a difference of two counts
+        confirmed = numpy.cumsum(entrance)
+
+        # Index of the next exit signal at or after every bar ('size' when there is none)
+        next_exit = numpy.where(exits, numpy.arange(size), size)
+        next_exit = numpy.minimum.accumulate(next_exit[::-1])[::-1]
+
+        base = 0
+        while True:
+            # First bar where the entrance signal has been confirmed since the last exit,
+            # like 'iterate' a position is only entered on a bar with an entrance signal
+            entry = numpy.searchsorted(confirmed, base + max(self.confirmation, 1))
+            if entry >= size:
+                break
+
+            # Enter the position and create stop loss value
+            self.entrance = price[entry]
+            self.investment = self.capital * self.percentage
+            self.shares = self.investment//self.entrance
+            self.capital -= (self.entrance * self.shares)
+            self.inPosition = True
+            self.trades += 1
+            exit_price = price[entry] * (1.0 - self.stop_loss)
+
+            # Exit on the earlier of the stop loss or the next exit signal
+            signal_exit = next_exit[entry]
+            stopped = numpy.flatnonzero(exit_price >= price[entry:signal_exit + 1])
+            leave = entry + stopped[0] if len(stopped) else signal_exit
+            if leave >= size:
+                # Position is still held at the end of the data
+                held = numpy.flatnonzero(entrance[entry:])
+                self.current = price[entry + held[-1]]
+                self.roi = self.current * self.shares
+                break
+
+            # Calculate ROI and profit as well as leave current position
+            self.current = price[leave]
+            self.roi = self.current * self.shares
+            self.ledger.append(start + entry, start + leave, self.entrance, self.current, self.shares,
+                               ledger.STOP if len(stopped) else ledger.SIGNAL)
+            self.leavePosition(None)
+            base = confirmed[leave]
+
+        # Round total profit to two decimal places
+        self.total_profit = round(self.total_profit, 2)
+        self.profile.count('trades', len(self.ledger))
+
+    def statistics(self):
+        """
+        Summarizes the closed trades of the 'ledger' after a backtest
+        :return: Dictionary of win rate, drawdown, Sharpe ratio and exposure
+        """
+        return self.ledger.summary(self.starting_capital, len(self.df))
+
+    @profiling.staged('fills')
+    def applyFills(self, model):
+        """
+        Applies a 'fills.py' FillModel to the closed trades of the 'ledger'
+        after 'iterate' or 'vectorIterate'. The ledger, total profit, won and
+        lost counts are replaced by their values after trading costs
+        :param model: 'fills.FillModel' object
+        :return:
+        """
+        trades, costs = model.fill(self.ledger.trades, self.df)
+        self.ledger = ledger.TradeLedger.fromTrades(trades)
+        self.total_profit = round(float(trades['profit'].sum()), 2)
+        self.won = int(numpy.count_nonzero(trades['profit'] > 0))
+        self.lost = int(numpy.count_nonzero(trades['profit'] < 0))
+        self.costs = round(float(costs.sum()), 2)
+
+    def memoryUsage(self):
+        """
+        Measures the DataFrame, including the contents of object columns
+        :return: Integer number of bytes
+        """
+        return int(self.df.memory_usage(deep=True).sum())
 
-    def removeData(self):
+    @profiling.staged('removeData')
+    def removeData(self, start=sessions.MARKET_OPEN, end=sessions.MARKET_CLOSE):
         """
         This function removes pre-market and post-market
-        data from the Pandas DataFrame
+        data from the Pandas DataFrame in a single pass
+        :param start: HHMM integer session start, inclusive (930)
+        :param end: HHMM integer session end, inclusive (1600)
         :return:
         """
-        for row, column in self.df.iterrows():
-            time = str(column['TimeBarStart'])
-            time = time.replace(":", "")
-            time = int(time)
-            if time < 930 or time > 1600:
-                self.df.drop(row, inplace=True)
+        self.df = self.df[sessions.sessionMask(self.df['TimeBarStart'], start, end)]
+        self.session = (start, end)
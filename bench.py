@@ -0,0 +1,205 @@
+# Benchmark File
+
+# This python file times every stage of the backtest
+# pipeline on a database (e.g. one written by 'synthetic.py')
+# and saves the results as JSON so the hot paths can
+# be compared between commits
+
+# Imports
+import gc
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tracemalloc
+import backtest as backtest
+import query as query
+import kernels as kernels
+import fills as fills
+import datasource as datasource
+import profiling as profiling
+
+# Indicator periods used by 'gui.py'
+PERIODS = (50, 200, 9, 13, 26, 14)
+
+# Fill model timed by the 'applyFills' stage, with every cost and cap turned on
+FILLS = fills.FillModel(commission=0.0005, per_share=0.005, minimum=1.0, spread=0.5, participation=0.05, prints=20)
+
+
+def measure(setup, run, rows):
+    """
+    Times one pipeline stage, then runs it again under tracemalloc
+    for its peak memory so the tracing does not skew the timing
+    :param setup: Function returning the input of the stage (not timed)
+    :param run: Function of the stage taking the setup value
+    :param rows: Number of rows processed by the stage
+    :return: Dictionary of seconds, peak bytes and rows per second
+    """
+    state = setup()
+    gc.collect()
+    started = time.perf_counter()
+    run(state)
+    seconds = time.perf_counter() - started
+
+    state = setup()
+    gc.collect()
+    tracemalloc.start()
+    run(state)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': seconds, 'peak_bytes': peak, 'rows_per_sec': rows / seconds if seconds else 0.0}
+
+
+def revision():
+    """
+    Finds the git commit being measured
+    :return: String commit hash or None outside a git checkout
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(path, ticker, start, end, loop=False):
+    """
+    Runs every stage of the backtest pipeline for one ticker
+    :param path: Path of the SQLite database file
+    :param ticker: String ticker symbol (e.g. AAPL)
+    :param start: Integer starting date
+    :param end: Integer ending date
+    :param loop: Boolean value for whether or not to also time the row by row
+    'iterate' function, which is slow on large ranges
+    :return: Dictionary of benchmark settings and stage results
+    """
+    with datasource.pool(path, immutable=True).acquire() as connection:
+        return measureStages(connection.cursor(), path, ticker, start, end, loop)
+
+
+def measureStages(cursor, path, ticker, start, end, loop):
+    """
+    Runs the stages of 'benchmark' on an open cursor
+    :param cursor: SQLite cursor
+    :param path: Path of the SQLite database file
+    :param ticker: String ticker symbol (e.g. AAPL)
+    :param start: Integer starting date
+    :param end: Integer ending date
+    :param loop: Boolean value for whether or not to also time 'iterate'
+    :return: Dictionary of benchmark settings and stage results
+    """
+    data = query.readFromDB(ticker, start, end, cursor)
+    rows = len(data)
+
+    def built(lean=False):
+        return backtest.Backtest(data, query.COLUMNS, 1000000, 0.05, 0.2, 100, lean=lean)
+
+    def filled(lean=False):
+        test = built(lean)
+        test.fillTable(*PERIODS)
+        return test
+
+    def traded():
+        test = filled()
+        test.vectorIterate()
+        return test
+
+    def prices():
+        return built().df['VolumeWeightPrice'].to_numpy(dtype=float)
+
+    stages = {}
+    stages['readFromDB'] = measure(lambda: None, lambda state: query.readFromDB(ticker, start, end, cursor), rows)
+    stages['readArrays'] = measure(lambda: None, lambda state: query.readArrays(ticker, start, end, cursor), rows)
+    stages['DataFrame'] = measure(lambda: None, lambda state: built(), rows)
+    stages['DataFrame[lean]'] = measure(lambda: None, lambda state: built(True), rows)
+    stages['removeData'] = measure(built, lambda test: test.removeData(), rows)
+    stages['fillTable'] = measure(built, lambda test: test.fillTable(*PERIODS, engine='pandas'), rows)
+    stages['fillTable[kernels]'] = measure(built, lambda test: test.fillTable(*PERIODS, engine='kernels'), rows)
+    stages['fillTable[lean]'] = measure(lambda: built(True), lambda test: test.fillTable(*PERIODS), rows)
+    stages['kernels'] = measure(prices, lambda price: kernels.compute(price, PERIODS[:2], PERIODS[2:3],
+                                                                      (PERIODS[3:5],), PERIODS[5:]), rows)
+    stages['vectorIterate'] = measure(filled, lambda test: test.vectorIterate(), rows)
+    stages['applyFills'] = measure(traded, lambda test: test.applyFills(FILLS), rows)
+    if loop:
+        stages['iterate'] = measure(filled, lambda test: test.iterate(), rows)
+
+    # Size of the filled DataFrame with the default and the lean column types
+    frames = {'default': filled().memoryUsage(), 'lean': filled(True).memoryUsage()}
+    return {'commit': revision(), 'python': platform.python_version(), 'database': path,
+            'ticker': ticker, 'start': start, 'end': end, 'rows': rows, 'stages': stages, 'frames': frames}
+
+
+def profileRun(path, ticker, start, end):
+    """
+    Runs the backtest pipeline once with cProfile and tracemalloc
+    capture, to find where the time of a slow stage goes
+    :param path: Path of the SQLite database file
+    :param ticker: String ticker symbol (e.g. AAPL)
+    :param start: Integer starting date
+    :param end: Integer ending date
+    :return: 'profiling.py' Profiler of the run
+    """
+    profile = profiling.Profiler(cprofile=True, memory=True)
+    with datasource.pool(path, immutable=True).acquire() as connection:
+        with profile.stage('query'):
+            data = query.readArrays(ticker, start, end, connection.cursor())
+    test = backtest.Backtest(data, query.COLUMNS, 1000000, 0.05, 0.2, 100, profile=profile)
+    test.fillTable(*PERIODS)
+    test.vectorIterate()
+    test.applyFills(FILLS)
+    return profile
+
+
+def compare(before, after, threshold=0.1):
+    """
+    Compares two saved benchmark results stage by stage
+    :param before: Dictionary of the earlier results
+    :param after: Dictionary of the later results
+    :param threshold: Float slowdown ratio reported as a regression (0.1 is 10%)
+    :return: List of (stage, seconds before, seconds after, regression) tuples
+    """
+    report = []
+    for stage, result in after['stages'].items():
+        if stage in before['stages']:
+            old = before['stages'][stage]['seconds']
+            report.append((stage, old, result['seconds'], result['seconds'] > old * (1 + threshold)))
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the backtest pipeline")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), default=None,
+                        help="Compare two saved JSON results instead of running")
+    parser.add_argument('--db', default='synthetic.db', help="SQLite database file")
+    parser.add_argument('--ticker', default='CVX', help="Ticker symbol")
+    parser.add_argument('--start', type=int, default=0, help="Starting date")
+    parser.add_argument('--end', type=int, default=99999999, help="Ending date")
+    parser.add_argument('--loop', action='store_true', help="Also time the row by row 'iterate' function")
+    parser.add_argument('--output', default=None, help="JSON file for the results")
+    parser.add_argument('--profile', action='store_true',
+                        help="Also print a cProfile and peak memory report of one backtest")
+    arguments = parser.parse_args()
+
+    if arguments.compare is not None:
+        with open(arguments.compare[0]) as before, open(arguments.compare[1]) as after:
+            report = compare(json.load(before), json.load(after))
+        for stage, old, new, regression in report:
+            print(stage.ljust(20) + str(round(old, 4)).rjust(10) + str(round(new, 4)).rjust(10) +
+                  ("  REGRESSION" if regression else ""))
+        sys.exit(1 if any(regression for stage, old, new, regression in report) else 0)
+
+    results = benchmark(arguments.db, arguments.ticker, arguments.start, arguments.end, arguments.loop)
+    print(str(results['rows']) + " rows of " + results['ticker'])
+    for stage, result in results['stages'].items():
+        print(stage.ljust(20) + (str(round(result['seconds'], 4)) + " s").rjust(12) +
+              (str(result['peak_bytes'] // 1024) + " KiB").rjust(14) +
+              (str(int(result['rows_per_sec'])) + " rows/s").rjust(18))
+    for kind, size in results['frames'].items():
+        print(("DataFrame " + kind).ljust(20) + (str(size // 1024) + " KiB").rjust(26))
+    if arguments.output is not None:
+        with open(arguments.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    if arguments.profile:
+        print(profileRun(arguments.db, arguments.ticker, arguments.start, arguments.end).report())
@@ -0,0 +1,105 @@
+# Indicator Cache File
+
+# This python file keeps computed indicator columns
+# so repeated backtests of the same data and periods
+# skip the calculations in 'indicators.py'
+# FUNCTIONS ARE UTILIZED IN 'backtest.py'
+
+# Imports
+import os
+import hashlib
+import collections
+import numpy as numpy
+
+# Default memory cap of the cache in bytes
+CAPACITY = 256 * 1024 * 1024
+
+
+class IndicatorCache:
+    """
+    This class is a least recently used cache of indicator columns. Keys are
+    tuples of the data the column was computed from (ticker, date range, price
+    column) and the indicator with its periods. Entries are evicted once the
+    cached arrays use more than the memory cap, and with a directory set every
+    column is also written to disk so it survives restarts and evictions
+    """
+
+    def __init__(self, capacity=CAPACITY, directory=None):
+        """
+        Constructs an indicator cache
+
+        :param capacity: Integer memory cap in bytes
+        :param directory: Optional directory for the on-disk tier
+        """
+        self.capacity = capacity
+        self.directory = directory
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key):
+        """
+        Returns the on-disk file of a key
+        :param key: Tuple cache key
+        :return: String file path
+        """
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode()).hexdigest() + '.npy')
+
+    def get(self, key):
+        """
+        Looks up a column in memory and then on disk
+        :param key: Tuple cache key
+        :return: NumPy array or None if the column is not cached
+        """
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        if self.directory is not None and os.path.isfile(self.path(key)):
+            values = numpy.load(self.path(key))
+            self.store(key, values)
+            self.hits += 1
+            return values
+        self.misses += 1
+        return None
+
+    def put(self, key, values):
+        """
+        Adds a column to the cache and to the on-disk tier
+        :param key: Tuple cache key
+        :param values: NumPy array
+        :return:
+        """
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            numpy.save(self.path(key), values)
+        self.store(key, values)
+
+    def store(self, key, values):
+        """
+        Adds a column to memory and evicts the least recently used
+        columns until the cache is back under its memory cap
+        :param key: Tuple cache key
+        :param values: NumPy array
+        :return:
+        """
+        if key in self.entries:
+            self.size -= self.entries.pop(key).nbytes
+        values.setflags(write=False)
+        self.entries[key] = values
+        self.size += values.nbytes
+        while self.size > self.capacity and self.entries:
+            self.size -= self.entries.popitem(last=False)[1].nbytes
+
+    def clear(self):
+        """
+        Empties the in-memory tier of the cache
+        :return:
+        """
+        self.entries.clear()
+        self.size = 0
+
+
+# Cache shared by the backtests of one process
+CACHE = IndicatorCache()
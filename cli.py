@@ -0,0 +1,209 @@
+# Command Line File
+
+# This python file runs backtests without the TKinter GUI,
+# either from command line arguments or from a JSON/YAML
+# job file with many runs, so backtests can run on servers
+# and in scheduled batch jobs. It only imports the backtest
+# stack, never 'gui.py' or tkinter
+
+# Imports
+import time
+
+# Start of the process, used to report the time to the first result
+STARTED = time.perf_counter()
+
+import os
+import sys
+import json
+import argparse
+import concurrent.futures
+import pandas as pandas
+import query as query
+import datasource as datasource
+import sweep as sweep
+import fills as fills
+import results as results
+import profiling as profiling
+
+
+def loadJobs(path):
+    """
+    Reads a job file. The file holds either a list of runs or an object
+    with a 'runs' list and optional 'defaults' applied to every run. A run
+    names a 'ticker', 'start', 'end' and 'capital', an optional 'timeframe',
+    optional 'sweep.RULES' rule text, 'fills.COSTS' trading costs and any
+    'sweep.DEFAULTS' parameter. A negative 'confirmation' is rejected.
+    Files ending in '.yaml' or '.yml' need PyYAML
+    :param path: Path of the JSON or YAML job file
+    :return: List of job dictionaries
+    """
+    with open(path) as jobs:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml
+            content = yaml.safe_load(jobs)
+        else:
+            content = json.load(jobs)
+    if isinstance(content, list):
+        content = {'runs': content}
+    jobs = [dict(content.get('defaults', {}), **run) for run in content['runs']]
+    for job in jobs:
+        if job.get('confirmation', 0) < 0:
+            raise ValueError("Negative confirmation period in job: " + str(job))
+    return jobs
+
+
+def runJob(path, job, store=None, rerun=False, profile=False):
+    """
+    Runs one job in a worker process. With a results database the job is
+    looked up first and only backtested when no run with the same settings
+    and data is stored, and every new run is recorded. With 'profile' the
+    stages are captured with cProfile and tracemalloc and the report is
+    kept in the 'profile' column
+    :param path: Path of the SQLite database file
+    :param job: Job dictionary with 'ticker', 'start', 'end', 'capital'
+    and optional 'timeframe', 'fills.COSTS' and 'sweep.DEFAULTS' parameters
+    :param store: Optional path of the 'results.py' database
+    :param rerun: Boolean value for whether or not to backtest and record
+    the job even when it is stored
+    :param profile: Boolean value for whether or not to profile the job
+    :return: Result dictionary of the job settings and 'sweep.RESULTS' values
+    """
+    profiler = profiling.Profiler(cprofile=True, memory=True) if profile else profiling.DISABLED
+    names = set(sweep.DEFAULTS) | set(sweep.RULES) | set(fills.COSTS)
+    unknown = set(job) - names - {'ticker', 'start', 'end', 'capital', 'timeframe'}
+    if unknown:
+        raise ValueError("Unknown job settings: " + ", ".join(sorted(unknown)))
+    config = dict(sweep.DEFAULTS, **fills.COSTS)
+    config.update((name, value) for name, value in job.items() if name in names)
+    settings = dict(config, ticker=job['ticker'], start=job['start'], end=job['end'], capital=job['capital'],
+                    timeframe=job.get('timeframe'))
+    with datasource.pool(path, immutable=True).acquire() as connection:
+        if store is not None:
+            digest = results.fingerprint(connection.cursor(), job['ticker'], job['start'], job['end'],
+                                         timeframe=job.get('timeframe'))
+            key = results.runKey(settings, digest)
+            run = None if rerun else results.ResultStore(store).lookup(key)
+            if run is not None:
+                return dict(settings, **{name: run[name] for name in sweep.RESULTS})
+        with profiler.stage('query'):
+            data = query.readArrays(job['ticker'], job['start'], job['end'], connection.cursor(),
+                                    timeframe=job.get('timeframe'))
+    test = sweep.runTest(data, job['capital'], config, timeframe=job.get('timeframe'), profile=profiler)
+    result = dict(settings, **sweep.summarize(config, test))
+    if profile:
+        result['profile'] = profiler.report()
+    if store is not None:
+        results.ResultStore(store).record(key, settings, digest, result, test.ledger.trades)
+    return result
+
+
+def runJobs(path, jobs, workers=None, store=None, rerun=False, profile=False):
+    """
+    Runs the jobs in parallel on a process pool. A job that fails keeps
+    its settings and the error message in the 'error' column, and the
+    other jobs still report their results
+    :param path: Path of the SQLite database file
+    :param jobs: List of job dictionaries
+    :param workers: Number of worker processes (defaults to the CPU count)
+    :param store: Optional path of the 'results.py' database
+    :param rerun: Boolean value for whether or not to backtest stored jobs again
+    :param profile: Boolean value for whether or not to profile the jobs,
+    which adds the 'profile' column of reports
+    :return: Tuple of the Pandas DataFrame of results in job order and the
+    seconds from process start to the first finished job
+    """
+    first = None
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        futures = {pool.submit(runJob, path, job, store, rerun, profile): number for number, job in enumerate(jobs)}
+        results = [None] * len(jobs)
+        for future in concurrent.futures.as_completed(futures):
+            number = futures[future]
+            try:
+                results[number] = future.result()
+            except Exception as error:
+                settings = dict(dict(sweep.DEFAULTS, **fills.COSTS), **jobs[number])
+                results[number] = dict(settings, error=type(error).__name__ + ": " + str(error))
+            if first is None:
+                first = time.perf_counter() - STARTED
+    columns = (['ticker', 'start', 'end', 'capital', 'timeframe'] + list(sweep.DEFAULTS) + sweep.RULES +
+               list(fills.COSTS) + sweep.RESULTS + ['error'] + (['profile'] if profile else []))
+    return pandas.DataFrame(results, columns=columns), first
+
+
+def writeResults(table, path):
+    """
+    Writes the results as CSV, or as JSON records if the path ends in '.json'
+    :param table: Pandas DataFrame of results
+    :param path: Output file path
+    :return:
+    """
+    if path.endswith('.json'):
+        table.to_json(path, orient='records', indent=2)
+    else:
+        table.to_csv(path, index=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run backtests of the financial thesis without the GUI")
+    parser.add_argument('--jobs', default=None, help="JSON or YAML job file with many runs")
+    parser.add_argument('--tickers', nargs='+', default=[], help="Ticker symbols (e.g. AAPL GE)")
+    parser.add_argument('--time', default=None, help="Time period to backtest (e.g. 20150514,20150527)")
+    parser.add_argument('--capital', type=int, default=1000000, help="Amount of capital for trades")
+    parser.add_argument('--risk', type=float, default=sweep.DEFAULTS['percentage'],
+                        help="Percentage of capital used on a given trade (e.g. 0.2)")
+    for name, value in sweep.DEFAULTS.items():
+        if name != 'percentage':
+            parser.add_argument('--' + name.replace('_', '-'), dest=name, type=type(value), default=value)
+    parser.add_argument('--timeframe', default=None, help="Rollup bar timeframe (e.g. 15m) instead of minute bars")
+    parser.add_argument('--entry', default=None, help="Entrance rule, e.g. 'cross(SMA_FAST, SMA_SLOW) & RSI >= 60'")
+    parser.add_argument('--exit', default=None, help="Exit rule, e.g. 'MACD < 0 | RSI < 50'")
+    for name, value in fills.COSTS.items():
+        parser.add_argument('--' + name.replace('_', '-'), dest=name, type=float, default=value)
+    parser.add_argument('--db', default='trading.db', help="SQLite database file")
+    parser.add_argument('--results', default=results.PATH, help="Results database file of stored runs")
+    parser.add_argument('--no-results', dest='results', action='store_const', const=None,
+                        help="Neither look up nor record runs")
+    parser.add_argument('--rerun', action='store_true', help="Backtest and record runs that are already stored")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes")
+    parser.add_argument('--output', default=None, help="CSV or JSON file for the results")
+    parser.add_argument('--profile', action='store_true',
+                        help="Print a cProfile and peak memory report of every backtested job")
+    arguments = parser.parse_args()
+
+    jobs = []
+    if arguments.jobs is not None:
+        jobs = loadJobs(arguments.jobs)
+    if arguments.tickers:
+        if arguments.time is None:
+            parser.error("--time is required with --tickers")
+        start, end = map(int, arguments.time.split(','))
+        settings = {name: getattr(arguments, name) for name in list(sweep.DEFAULTS) + list(fills.COSTS)
+                    if name != 'percentage'}
+        for ticker in arguments.tickers:
+            jobs.append(dict(settings, ticker=ticker, start=start, end=end, capital=arguments.capital,
+                             percentage=arguments.risk, timeframe=arguments.timeframe,
+                             entry_rule=arguments.entry, exit_rule=arguments.exit))
+    if not jobs:
+        parser.error("give --tickers and --time or a --jobs file")
+    if arguments.confirmation < 0:
+        parser.error("--confirmation can not be negative")
+    if not os.path.isfile(arguments.db):
+        parser.error(arguments.db + " does not exist")
+
+    table, first = runJobs(arguments.db, jobs, arguments.workers, arguments.results, arguments.rerun,
+                           arguments.profile)
+    if arguments.profile:
+        # Stored and failed jobs have no report
+        for (ticker, start, end), report in zip(table[['ticker', 'start', 'end']].itertuples(index=False),
+                                                table.pop('profile')):
+            if isinstance(report, str):
+                print(ticker + " " + str(start) + "-" + str(end) + "\n" + report, file=sys.stderr)
+    failed = table['error'].notna()
+    print(table[['ticker', 'start', 'end'] + sweep.RESULTS + (['error'] if failed.any() else [])]
+          .to_string(index=False))
+    print("First result after " + str(round(first, 3)) + " s, all " + str(len(jobs)) + " after " +
+          str(round(time.perf_counter() - STARTED, 3)) + " s, " + str(int(failed.sum())) + " failed",
+          file=sys.stderr)
+    if arguments.output is not None:
+        writeResults(table, arguments.output)
+    sys.exit(1 if failed.any() else 0)
@@ -0,0 +1,124 @@
+# Columnar Store File
+
+# This python file keeps an optional columnar copy of
+# 'trading.db' with one directory per ticker and one
+# memory mapped NumPy '.npy' file per column, so a
+# backtest can load a date range without building
+# a Python tuple for every bar
+# FUNCTIONS ARE UTILIZED IN 'gui.py'
+
+# Imports
+import os
+import json
+import argparse
+import numpy as numpy
+import query as query
+import datasource as datasource
+
+# Default directory of the columnar store
+ROOT = 'columnar'
+
+
+def signature(ticker, cursor):
+    """
+    Summarizes the rows of a ticker in 'trading.db' to detect whether the
+    columnar copy is out of date. Uses the (Ticker, Date, TimeBarStart) index
+    :param ticker: String ticker symbol (e.g. AAPL)
+    :param cursor: SQLite cursor
+    :return: List of row count, first date and last date
+    """
+    cursor.execute('SELECT COUNT(*), MIN(Date), MAX(Date) FROM Algo_Trading WHERE Ticker=?', (ticker,))
+    return list(cursor.fetchone())
+
+
+def exists(ticker, root=ROOT):
+    """
+    Checks if a ticker has been written to the columnar store
+    :param ticker: String ticker symbol (e.g. AAPL)
+    :param root: Directory of the columnar store
+    :return: Boolean value
+    """
+    return os.path.isfile(os.path.join(root, ticker, 'meta.json'))
+
+
+def buildTicker(ticker, cursor, root=ROOT):
+    """
+    Writes every row of a ticker from 'trading.db' into the columnar store,
+    sorted by date and bar start time. Rows are read in chunks with
+    'query.readArrays'
+    :param ticker: String ticker symbol (e.g. AAPL)
+    :param cursor: SQLite cursor
+    :param root: Directory of the columnar store
+    :return: Number of rows written
+    """
+    summary = signature(ticker, cursor)
+    arrays = query.readArrays(ticker, summary[1], summary[2], cursor)
+    del arrays['Ticker']
+
+    # Sort within each day by bar start time
+    order = numpy.lexsort((arrays['TimeBarStart'], arrays['Date']))
+    directory = os.path.join(root, ticker)
+    os.makedirs(directory, exist_ok=True)
+    for column, values in arrays.items():
+        numpy.save(os.path.join(directory, column + '.npy'), values[order])
+    with open(os.path.join(directory, 'meta.json'), 'w') as meta:
+        json.dump({'signature': summary}, meta)
+    return summary[0]
+
+
+def syncTicker(ticker, cursor, root=ROOT):
+    """
+    Rebuilds the columnar copy of a ticker if 'trading.db' has changed
+    :param ticker: String ticker symbol (e.g. AAPL)
+    :param cursor: SQLite cursor
+    :param root: Directory of the columnar store
+    :return: Boolean value for whether or not the ticker was rebuilt
+    """
+    if exists(ticker, root):
+        with open(os.path.join(root, ticker, 'meta.json')) as meta:
+            if json.load(meta)['signature'] == signature(ticker, cursor):
+                return False
+    buildTicker(ticker, cursor, root)
+    return True
+
+
+def loadRange(ticker, start, end, root=ROOT):
+    """
+    Loads a date range of a ticker from the columnar store. The columns are
+    memory mapped and the range is found by binary search on 'Date', so the
+    returned arrays are views into the mapped files and nothing is read until
+    it is used. The result can be passed to 'Backtest' in place of a query
+    :param ticker: String ticker symbol (e.g. AAPL)
+    :param start: Integer starting date
+    :param end: Integer ending date
+    :param root: Directory of the columnar store
+    :return: Dictionary of column labels and NumPy arrays
+    """
+    directory = os.path.join(root, ticker)
+    dates = numpy.load(os.path.join(directory, 'Date.npy'), mmap_mode='r')
+    first = numpy.searchsorted(dates, start, side='left')
+    last = numpy.searchsorted(dates, end, side='right')
+
+    data = {}
+    for column in query.COLUMNS:
+        if column == 'Ticker':
+            data[column] = numpy.full(last - first, ticker, dtype=object)
+        else:
+            data[column] = numpy.load(os.path.join(directory, column + '.npy'), mmap_mode='r')[first:last]
+    return data
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build or refresh the columnar copy of 'trading.db'")
+    parser.add_argument('tickers', nargs='*', help="Ticker symbols (defaults to every ticker)")
+    parser.add_argument('--root', default=ROOT, help="Directory of the columnar store")
+    arguments = parser.parse_args()
+
+    with datasource.pool().acquire() as connection:
+        cursor = connection.cursor()
+        tickers = arguments.tickers
+        if not tickers:
+            tickers = [row[0] for row in cursor.execute('SELECT DISTINCT Ticker FROM Algo_Trading')]
+        for ticker in tickers:
+            if syncTicker(ticker, cursor, arguments.root):
+                print("Rebuilt " + ticker)
@@ -5,16 +5,20 @@ import sqlite3 as sqlite3
 import pandas as pandas
 import os
 import glob
-
-
-# Create connection and cursor
-connection = sqlite3.connect('trading.db')
-cursor = connection.cursor()
+import argparse
+import time
+import itertools
+import collections
+import concurrent.futures
+import numpy as numpy
+import query as query
+import timeframes as timeframes
 
 # Create table for trading.db
-def create_table():
+def create_table(cursor):
     """
     Create a SQLite table to be converted to a Pandas DataFram
+    :param cursor: SQLite cursor
     :return:
     """
     try:
@@ -23,8 +27,58 @@ def create_table():
         print("Table not created")
 
 
-# Create 'Algo_Trading' table
-create_table()
+# Name of the composite index used by the backtest query
+INDEX_NAME = 'Algo_Trading_Ticker_Date'
+
+
+def set_pragmas(connection):
+    """
+    Switches 'trading.db' to write-ahead logging, which is stored in the
+    database file, and applies the read pragmas from 'query.py'
+    :param connection: SQLite connection
+    :return:
+    """
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    query.tuneConnection(connection)
+
+
+def create_index(connection):
+    """
+    Create the composite (Ticker, Date, TimeBarStart) index so the backtest
+    query is an index range search that is already in date order
+    :param connection: SQLite connection
+    :return:
+    """
+    connection.execute('CREATE INDEX IF NOT EXISTS ' + INDEX_NAME + ' ON Algo_Trading(Ticker, Date, TimeBarStart)')
+    connection.execute('ANALYZE')
+    connection.commit()
+
+
+def explain_query(connection, session=None):
+    """
+    Runs EXPLAIN QUERY PLAN on the backtest query from 'query.py' and checks
+    that it searches the composite index without a separate sort step
+    :param connection: SQLite connection
+    :param session: Optional (start, end) HHMM session tuple
+    :return: List of query plan detail strings
+    """
+    sql, bounds = query.buildQuery(session)
+    plan = [row[-1] for row in connection.execute('EXPLAIN QUERY PLAN ' + sql, ('AAPL', 0, 0) + bounds)]
+    if not any(INDEX_NAME in detail for detail in plan) or any('TEMP B-TREE' in detail for detail in plan):
+        raise RuntimeError("Backtest query does not use " + INDEX_NAME + ": " + "; ".join(plan))
+    return plan
+
+
+def migrate(connection):
+    """
+    Brings an existing 'trading.db' up to the indexed layout
+    :param connection: SQLite connection
+    :return: Query plan of the backtest query
+    """
+    set_pragmas(connection)
+    create_index(connection)
+    return explain_query(connection)
 
 
 # ***ONLY NEEDED IF TABLE NEEDS TO BE REMOVED***
@@ -35,17 +89,192 @@ create_table()
 rootdir2015 = '2015/2015/**'
 rootdir2016 = '2016/**'
 
-# Import 2015 data to trading.db (Algo_Trading table)
-# for filename in glob.iglob(rootdir2015, recursive=True):
-#     if os.path.isfile(filename): # filter directories
-#         df = pandas.read_csv(filename)
-#         df.to_sql('Algo_Trading', connection, if_exists='append', index=False)
+# Rows inserted per transaction during ingest
+INGEST_BATCH = 500000
+
+# Parsed files waiting to be written per parser process during ingest
+INGEST_WINDOW = 2
+
+
+def create_manifest(connection):
+    """
+    Create the manifest table that records every CSV file already
+    loaded into 'Algo_Trading' so ingest can be re-run safely
+    :param connection: SQLite connection
+    :return:
+    """
+    connection.execute('CREATE TABLE IF NOT EXISTS Ingest_Manifest(Path TEXT PRIMARY KEY, Size INTEGER, Mtime REAL, Rows INTEGER)')
+
+
+def find_files(patterns, connection):
+    """
+    Expands the data directory patterns and leaves out files that are
+    recorded in the manifest with the same size and modification time.
+    Files recorded with another size or time have been changed since
+    they were loaded and are loaded again
+    :param patterns: List of recursive glob patterns (e.g. '2016/**')
+    :param connection: SQLite connection
+    :return: List of (path, size, mtime, changed) tuples still to be loaded
+    """
+    loaded = {row[0]: tuple(row[1:]) for row in connection.execute('SELECT Path, Size, Mtime FROM Ingest_Manifest')}
+    files = []
+    seen = set()
+    for pattern in patterns:
+        for filename in sorted(glob.iglob(pattern, recursive=True)):
+            if os.path.isfile(filename) and filename not in seen: # filter directories
+                seen.add(filename)
+                status = os.stat(filename)
+                if loaded.get(filename) != (status.st_size, status.st_mtime):
+                    files.append((filename, status.st_size, status.st_mtime, filename in loaded))
+    return files
+
+
+def file_days(filename):
+    """
+    Reads the (Ticker, Date) pairs of a CSV file
+    :param filename: Path of the CSV file
+    :return: List of (ticker, date) tuples
+    """
+    days = pandas.read_csv(filename, usecols=['Ticker', 'Date']).drop_duplicates()
+    return list(zip(days['Ticker'].tolist(), days['Date'].tolist()))
+
+
+def parse_file(filename):
+    """
+    Reads one daily CSV file into compact 'Algo_Trading' columns. Runs in
+    the worker processes of 'ingest'. Numeric columns are NumPy arrays and
+    text columns ('Ticker', 'TimeBarStart') are integer codes into their
+    distinct values, so a parsed file costs little to send and to hold
+    :param filename: Path of the CSV file
+    :return: List of NumPy arrays or (codes, values) tuples in 'query.COLUMNS' order
+    """
+    df = pandas.read_csv(filename, usecols=query.COLUMNS)
+    columns = []
+    for column in query.COLUMNS:
+        values = df[column].to_numpy()
+        if values.dtype == object:
+            codes, uniques = pandas.factorize(values, use_na_sentinel=False)
+            values = (codes.astype(numpy.int16 if len(uniques) < 2 ** 15 else numpy.int32), uniques)
+        elif values.dtype.kind == 'i' and column in query.DTYPES:
+            values = values.astype(query.DTYPES[column])
+        columns.append(values)
+    return columns
+
+
+def file_rows(columns):
+    """
+    Turns the columns of 'parse_file' back into row tuples
+    :param columns: List of NumPy arrays or (codes, values) tuples
+    :return: Tuple of the number of rows and an iterator of row tuples in 'query.COLUMNS' order
+    """
+    lists = [values[1][values[0]].tolist() if isinstance(values, tuple) else values.tolist()
+             for values in columns]
+    return len(lists[0]), zip(*lists)
+
+
+def ingest(patterns, connection, workers=None):
+    """
+    Loads the daily CSV files into 'Algo_Trading'. Files are parsed in parallel
+    on a process pool and streamed into the table with executemany inside large
+    transactions, with the backtest index dropped during the load and rebuilt
+    afterwards. At most 'INGEST_WINDOW' parsed files per parser process wait
+    for the writer, so memory stays bounded however many files are loaded.
+    Each file is written to the manifest in the same transaction as its rows,
+    so files that are already loaded are skipped on the next run. A file that
+    changed since it was loaded first has the rows of its tickers and days
+    deleted, while the index still exists, and is then loaded again
+    :param patterns: List of recursive glob patterns (e.g. '2016/**')
+    :param connection: SQLite connection
+    :param workers: Number of parser processes (defaults to the CPU count)
+    :return: Tuple of files loaded, rows loaded, rows per second and the
+    set of integer dates loaded, for 'timeframes.update'
+    """
+    create_manifest(connection)
+    files = find_files(patterns, connection)
+    if not files:
+        return 0, 0, 0.0, set()
+
+    started = time.perf_counter()
+    total = 0
+    pending = 0
+    dates = set()
+    for filename, size, mtime, changed in files:
+        if changed:
+            days = file_days(filename)
+            connection.executemany('DELETE FROM Algo_Trading WHERE Ticker=? AND Date=?', days)
+            dates.update(date for ticker, date in days)
+    # The manifest keeps the old size and time until the file is loaded again
+    connection.commit()
+    connection.execute('DROP INDEX IF EXISTS ' + INDEX_NAME)
+    connection.execute('PRAGMA synchronous=OFF')
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            window = INGEST_WINDOW * (workers or os.cpu_count() or 1)
+            queued = iter(files)
+            parsing = collections.deque((entry, pool.submit(parse_file, entry[0]))
+                                        for entry in itertools.islice(queued, window))
+            while parsing:
+                (filename, size, mtime, changed), future = parsing.popleft()
+                columns = future.result()
+                dates.update(numpy.unique(columns[query.COLUMNS.index('Date')]).tolist())
+                count, rows = file_rows(columns)
+                # Start parsing the next file while the rows of this one are written
+                entry = next(queued, None)
+                if entry is not None:
+                    parsing.append((entry, pool.submit(parse_file, entry[0])))
+                connection.executemany('INSERT INTO Algo_Trading VALUES (?,?,?,?,?,?,?,?,?,?)', rows)
+                connection.execute('INSERT OR REPLACE INTO Ingest_Manifest VALUES (?,?,?,?)',
+                                   (filename, size, mtime, count))
+                total += count
+                pending += count
+                if pending >= INGEST_BATCH:
+                    connection.commit()
+                    pending = 0
+        connection.commit()
+    finally:
+        connection.execute('PRAGMA synchronous=NORMAL')
+        create_index(connection)
+
+    elapsed = time.perf_counter() - started
+    return len(files), total, total / elapsed, dates
+
 
-# Import 2016 data to trading.db (Algo_Trading table)
-# for filename in glob.iglob(rootdir2016, recursive=True):
-#     if os.path.isfile(filename): # filter subdirectories
-#         df = pandas.read_csv(filename)
-#         df.to_sql('Algo_Trading', connection, if_exists='append', index=False)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Maintain the 'trading.db' database")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('migrate', help="Add the backtest index and pragmas to 'trading.db'")
+    commands.add_parser('explain', help="Show the query plan of the backtest query")
+    load = commands.add_parser('ingest', help="Load the daily CSV files into 'trading.db'")
+    load.add_argument('patterns', nargs='*', default=[rootdir2015, rootdir2016],
+                      help="Recursive glob patterns of the CSV files")
+    load.add_argument('--workers', type=int, default=None, help="Number of parser processes")
+    rollup = commands.add_parser('rollup', help="Build or update the multi-timeframe bar tables")
+    rollup.add_argument('timeframes', nargs='*', default=list(timeframes.TIMEFRAMES),
+                        help="Timeframes to roll up, any of " + ", ".join(timeframes.TIMEFRAMES) + " (defaults to all)")
+    arguments = parser.parse_args()
+    if arguments.command == 'rollup' and not set(arguments.timeframes) <= set(timeframes.TIMEFRAMES):
+        parser.error("unknown timeframe, choose from " + ", ".join(timeframes.TIMEFRAMES))
 
+    # Create connection and cursor
+    connection = sqlite3.connect('trading.db')
+    cursor = connection.cursor()
 
+    # Create 'Algo_Trading' table
+    create_table(cursor)
 
+    if arguments.command == 'ingest':
+        files, rows, rate, dates = ingest(arguments.patterns, connection, arguments.workers)
+        print("Loaded " + str(rows) + " rows from " + str(files) + " files (" + str(int(rate)) + " rows/sec)")
+        # Roll up the loaded days in the rollup tables that have already been built
+        built = timeframes.existing(connection)
+        if files and built:
+            print("Rolled up " + str(timeframes.update(connection, built, changed=dates)) + " bars")
+    elif arguments.command == 'rollup':
+        print("Rolled up " + str(timeframes.update(connection, arguments.timeframes)) + " bars")
+    else:
+        if arguments.command == 'migrate':
+            plan = migrate(connection)
+        else:
+            plan = explain_query(connection)
+        for detail in plan:
+            print(detail)
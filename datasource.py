@@ -0,0 +1,108 @@
+# Data Source File
+
+# This python file hands out reusable read-only
+# connections to 'trading.db' so repeated backtests
+# do not open and leak a new connection every run
+# FUNCTIONS ARE UTILIZED IN 'gui.py', 'cli.py', 'sweep.py',
+# 'portfolio.py', 'replay.py' and 'bench.py'
+
+# Imports
+import os
+import pathlib
+import queue
+import threading
+import contextlib
+import sqlite3 as sqlite3
+import query as query
+
+# Default database file
+DATABASE = 'trading.db'
+
+# Pools of this process by database path and immutable flag
+_POOLS = {}
+_LOCK = threading.Lock()
+
+
+class ReadOnlyPool:
+    """
+    This class is a pool of read-only SQLite connections to one database.
+    Connections are opened with the URI 'mode=ro' flag, and optionally
+    'immutable=1' which also skips file locking when nothing writes to the
+    database during the run. Every connection gets the memory map and cache
+    pragmas from 'query.tuneConnection'. A thread borrows a connection with
+    'acquire' and gives it back afterwards, so connections and their warm
+    page caches are reused, and no connection is used by two threads at once.
+    Connections of a parent process are never reused in a forked child
+    """
+
+    def __init__(self, path=DATABASE, immutable=False):
+        """
+        Constructs a pool without opening any connection yet
+
+        :param path: Path of the SQLite database file
+        :param immutable: Boolean value for whether or not the database
+        can be treated as unchanging while the pool is used
+        """
+        self.path = os.path.abspath(path)
+        self.uri = pathlib.Path(self.path).resolve().as_uri() + '?mode=ro' + ('&immutable=1' if immutable else '')
+        self.idle = queue.LifoQueue()
+        self.process = os.getpid()
+        self.opened = 0
+
+    def connect(self):
+        """
+        Opens a new read-only connection
+        :return: SQLite connection
+        """
+        if not os.path.isfile(self.path):
+            raise FileNotFoundError(self.path)
+        connection = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        query.tuneConnection(connection)
+        self.opened += 1
+        return connection
+
+    @contextlib.contextmanager
+    def acquire(self):
+        """
+        Borrows a connection from the pool, opening one if none is idle
+        :return: Context manager giving a SQLite connection
+        """
+        if self.process != os.getpid():
+            # Forked child, start with an empty pool
+            self.idle = queue.LifoQueue()
+            self.process = os.getpid()
+            self.opened = 0
+        try:
+            connection = self.idle.get_nowait()
+        except queue.Empty:
+            connection = self.connect()
+        try:
+            yield connection
+        finally:
+            self.idle.put(connection)
+
+    def close(self):
+        """
+        Closes every idle connection of the pool
+        :return:
+        """
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def pool(path=DATABASE, immutable=False):
+    """
+    Returns the shared pool of this process for a database
+    :param path: Path of the SQLite database file
+    :param immutable: Boolean value for whether or not the database
+    can be treated as unchanging while the pool is used
+    :return: ReadOnlyPool object
+    """
+    key = (os.path.abspath(path), immutable)
+    with _LOCK:
+        if key not in _POOLS:
+            _POOLS[key] = ReadOnlyPool(path, immutable)
+        return _POOLS[key]
@@ -0,0 +1,111 @@
+# Fills File
+
+# This python file models the cost of trading. The trades of a
+# backtest are filled at the bar's 'VolumeWeightPrice'; a fill
+# model then charges commissions, crosses part of the bar's
+# high to low range as the spread and caps the shares at a
+# share of the bar's volume. The model is applied to every trade
+# of the ledger at once with NumPy, after the backtest has run
+# FUNCTIONS ARE UTILIZED IN 'backtest.py'
+
+# Imports
+import numpy as numpy
+
+# Configuration entries of a fill model and their values without trading costs
+COSTS = {'commission': 0.0, 'per_share': 0.0, 'minimum': 0.0, 'spread': 0.0,
+         'participation': 0.0, 'prints': 0.0}
+
+
+class FillModel:
+    """
+    This class turns the fills of a backtest into realistic fills.
+    Every entrance and exit pays the commission and half of the
+    estimated spread, and a trade holds no more shares than the
+    participation caps allow on its entrance and exit bars
+    """
+
+    def __init__(self, commission=0.0, per_share=0.0, minimum=0.0, spread=0.0, participation=0.0, prints=0.0):
+        """
+        Constructs a fill model, a value of 0 turns its cost or cap off
+
+        :param commission: Float commission as a fraction of the traded value (0.0005 is 5 bps)
+        :param per_share: Float commission per share traded
+        :param minimum: Float minimum commission of an order
+        :param spread: Float fraction of the bar's 'HighTradePrice' to
+        'LowTradePrice' range taken as the bid-ask spread, half of it is paid on every fill
+        :param participation: Float largest fraction of the bar's 'Volume' a fill may take
+        :param prints: Float largest number of average sized trades ('Volume' / 'TotalTrades') a fill may take
+        """
+        self.commission = commission
+        self.per_share = per_share
+        self.minimum = minimum
+        self.spread = spread
+        self.participation = participation
+        self.prints = prints
+
+    def fees(self, price, shares):
+        """
+        :param price: NumPy float array of fill prices
+        :param shares: NumPy float array of shares traded
+        :return: NumPy float array of the commission of every order
+        """
+        fees = numpy.maximum(self.commission * price * shares + self.per_share * shares, self.minimum)
+        return numpy.where(shares > 0, fees, 0.0)
+
+    def capacity(self, df, rows):
+        """
+        Finds the most shares a fill may take on bars
+        :param df: Pandas DataFrame or dictionary of column arrays of the backtest
+        :param rows: NumPy int array of row indices
+        :return: NumPy float array of share caps (infinite without a cap)
+        """
+        cap = numpy.full(len(rows), numpy.inf)
+        if self.participation or self.prints:
+            volume = numpy.asarray(df['Volume'], dtype=float)[rows]
+            if self.participation:
+                cap = numpy.minimum(cap, numpy.floor(self.participation * volume))
+            if self.prints:
+                trades = numpy.asarray(df['TotalTrades'], dtype=float)[rows]
+                average = numpy.divide(volume, trades, out=numpy.zeros(len(rows)), where=trades > 0)
+                cap = numpy.minimum(cap, numpy.floor(self.prints * average))
+        return cap
+
+    def fill(self, trades, df):
+        """
+        Applies the model to every trade of a ledger at once. The entry and
+        exit bars stay the same, and the profits do not change the size of
+        later trades the way they would inside the backtest
+        :param trades: 'ledger.TRADE' structured array (e.g. 'TradeLedger.trades')
+        :param df: Pandas DataFrame or dictionary of column arrays the trade
+        indices refer to, with 'HighTradePrice', 'LowTradePrice', 'Volume'
+        and 'TotalTrades' when the spread and caps are used
+        :return: Tuple of the filled 'ledger.TRADE' structured array and a
+        NumPy float array of the commissions of every trade
+        """
+        filled = trades.copy()
+        entry = trades['entry']
+        leave = trades['exit']
+
+        shares = numpy.minimum(trades['shares'], numpy.minimum(self.capacity(df, entry), self.capacity(df, leave)))
+        if self.spread:
+            half = self.spread / 2 * (numpy.asarray(df['HighTradePrice'], dtype=float) -
+                                      numpy.asarray(df['LowTradePrice'], dtype=float))
+            filled['entry_price'] += half[entry]
+            filled['exit_price'] -= half[leave]
+
+        costs = self.fees(filled['entry_price'], shares) + self.fees(filled['exit_price'], shares)
+        filled['shares'] = shares
+        filled['profit'] = (filled['exit_price'] - filled['entry_price']) * shares - costs
+        return filled, costs
+
+
+def fromConfig(config):
+    """
+    Builds the fill model of a configuration
+    :param config: Configuration dictionary with optional 'COSTS' entries
+    :return: 'FillModel' object, or None when every cost and cap is off
+    """
+    values = {name: config.get(name) or default for name, default in COSTS.items()}
+    if not any(values.values()):
+        return None
+    return FillModel(**values)
@@ -2,10 +2,21 @@
 
 
 # Imports
+import sys
 import tkinter as tk
 from tkinter import ttk # CSS for tkinter
+import queue as queue
+import threading as threading
 import sqlite3 as sqlite3
 import backtest as backtest
+import datasource as datasource
+import columnar as columnar
+import cache as cache
+import profiling as profiling
+import timeframes as timeframes
+import sweep as sweep
+import fills as fills
+import results as results
 
 # Import 'query.py' module
 import query as query
@@ -15,8 +26,108 @@ TITLE_FONT = ("Verdana", 18)
 LARGE_FONT = ("Verdana", 12)
 
 # Column Label Constants
-COLUMNS = ['Date', 'Ticker', 'TimeBarStart','FirstTradePrice', 'HighTradePrice', 'LowTradePrice',
-          'LastTradePrice', 'VolumeWeightPrice', 'Volume', 'TotalTrades']
+COLUMNS = query.COLUMNS
+
+# Milliseconds between checks for messages from the backtest worker thread
+POLL_INTERVAL = 100
+
+# Timeframe menu label of the one minute 'Algo_Trading' bars
+MINUTE = '1m'
+
+# Capture every backtest with cProfile and tracemalloc when the GUI
+# is started with '--profile' (e.g. 'python main.py --profile')
+PROFILE = '--profile' in sys.argv
+
+
+class Cancelled(Exception):
+    """
+    Raised in the backtest worker thread when the
+    user cancels the running backtest
+    """
+
+
+def runBacktest(parameters, report, cancelled):
+    """
+    This function runs one backtest for the parameters entered in the GUI.
+    It runs on the worker thread of the 'StartPage' frame, reports each
+    stage through 'report' and stops between stages, or inside the SQLite
+    query, once the 'cancelled' event is set. A run already stored in the
+    'results.py' database for the same settings and data is returned from
+    it, and every new run is stored
+    :param parameters: Dictionary of input labels and user responses
+    :param report: Function taking a progress message string
+    :param cancelled: threading Event set when the user cancels the run
+    :return: 'backtest.py' object with the results
+    """
+    def checkpoint(message):
+        if cancelled.is_set():
+            raise Cancelled()
+        report(message)
+
+    # Time every stage of the backtest
+    profile = profiling.Profiler(cprofile=PROFILE, memory=PROFILE)
+
+    # Settings of the run, the thesis values of 'sweep.DEFAULTS' with the risk entered in the GUI
+    config = dict(sweep.DEFAULTS, percentage=parameters['Risk'], **fills.COSTS)
+    settings = dict(config, ticker=parameters['Ticker'], start=parameters['Time'][0], end=parameters['Time'][1],
+                    capital=parameters['Capital'], timeframe=parameters['Timeframe'])
+
+    # Borrow a read-only 'trading.db' connection, aborting the query when cancelled
+    with datasource.pool().acquire() as connection:
+        connection.set_progress_handler(cancelled.is_set, 100000)
+        try:
+            # Create SQLite cursor
+            cursor = connection.cursor()
+
+            # Return a stored run of the same settings and data
+            checkpoint("Looking up " + parameters['Ticker'] + " results")
+            with profile.stage('results'):
+                digest = results.fingerprint(cursor, parameters['Ticker'], parameters['Time'][0],
+                                             parameters['Time'][1], timeframe=parameters['Timeframe'])
+                key = results.runKey(settings, digest)
+                stored = results.STORE.restore(key, parameters['Capital'], profile)
+            if stored is not None:
+                return stored
+
+            # Load data from the columnar store when it has been built,
+            # otherwise query the 'trading.db' SQLite database
+            checkpoint("Loading " + parameters['Ticker'] + " data")
+            with profile.stage('query'):
+                if parameters['Timeframe'] is not None:
+                    data = query.readArrays(parameters['Ticker'], parameters['Time'][0], parameters['Time'][1], cursor,
+                                            timeframe=parameters['Timeframe'])
+                elif columnar.exists(parameters['Ticker']):
+                    columnar.syncTicker(parameters['Ticker'], cursor)
+                    data = columnar.loadRange(parameters['Ticker'], parameters['Time'][0], parameters['Time'][1])
+                else:
+                    data = query.readArrays(parameters['Ticker'], parameters['Time'][0], parameters['Time'][1], cursor)
+        except sqlite3.OperationalError:
+            if cancelled.is_set():
+                raise Cancelled()
+            raise
+        finally:
+            connection.set_progress_handler(None, 0)
+
+    # Construct a backtest object using 'backtest.py' module
+    checkpoint("Building table for " + parameters['Ticker'])
+    test = backtest.Backtest(data, COLUMNS, parameters['Capital'], config['stop_loss'], config['percentage'], 100,
+                             config['confirmation'], key=(parameters['Ticker'], parameters['Time'][0],
+                                                          parameters['Time'][1]),
+                             profile=profile, timeframe=parameters['Timeframe'])
+
+    # Fill the Pandas DataFrame with indicator parameters, reusing cached columns
+    checkpoint("Computing indicators for " + parameters['Ticker'])
+    test.fillTable(config['sma_fast'], config['sma_slow'], config['ema'], config['macd_fast'], config['macd_slow'],
+                   config['rsi_period'], cache.CACHE)
+
+    # Execute the financial thesis using the 'backtest.py' module vectorized engine
+    checkpoint("Running the financial thesis on " + parameters['Ticker'])
+    test.vectorIterate()
+
+    # Store the run for later lookups and comparisons
+    with profile.stage('results'):
+        results.STORE.record(key, settings, digest, sweep.summarize(config, test), test.ledger.trades)
+    return test
 
 
 class BackTestApp(tk.Tk):
@@ -102,6 +213,13 @@ class StartPage(tk.Frame):
         self.risk_entry = tk.Entry(self)
         self.risk_entry.grid(row=4, column=1, pady=10)
 
+        # Timeframe Labels and Menu, the longer timeframes need 'python database.py rollup'
+        timeframe_label = tk.Label(self, text="Timeframe:", font=LARGE_FONT)
+        timeframe_label.grid(row=1, column=4, pady=10, sticky="E")
+        self.timeframe = tk.StringVar(self, MINUTE)
+        timeframe_menu = ttk.OptionMenu(self, self.timeframe, MINUTE, MINUTE, *timeframes.TIMEFRAMES)
+        timeframe_menu.grid(row=1, column=5, pady=10, sticky="W")
+
         # Execute Button
         execute_button = ttk.Button(self, text="Execute", command=lambda: performBacktest())
         execute_button.grid(row=5, column=0, columnspan=2, pady=10, sticky="N")
@@ -110,6 +228,14 @@ class StartPage(tk.Frame):
         refresh_button = ttk.Button(self, text="Refresh", command=lambda: refresh())
         refresh_button.grid(row=5, column=2, columnspan=2, pady=10, sticky="N")
 
+        # Cancel Button
+        cancel_button = ttk.Button(self, text="Cancel", command=lambda: cancel())
+        cancel_button.grid(row=5, column=4, pady=10, sticky="N")
+
+        # Progress of the queued backtests
+        self.status = tk.Label(self, text="")
+        self.status.grid(row=10, column=0, columnspan=4, pady=10, sticky="W")
+
         # Ticker Instructions and Placement
         ticker_instructions = tk.Label(self,text="Please choose a ticker symbol from the "
                                           "25 symbols provided in the link below")
@@ -142,6 +268,13 @@ class StartPage(tk.Frame):
         self.total_profit = None
         self.total_trades = None
         self.total_won = None
+        self.timings = None
+
+        # Backtest worker thread, its queue of runs and its messages to the GUI
+        self.worker = None
+        self.runs = queue.Queue()
+        self.messages = queue.Queue()
+        self.cancelled = threading.Event()
 
         def getParameters():
             """
@@ -158,42 +291,74 @@ class StartPage(tk.Frame):
             time_parameters = self.time_entry.get().split(',')
             parameters['Time'] = list(map(int, time_parameters))
             parameters['Risk'] = float(self.risk_entry.get())
+            parameters['Timeframe'] = None if self.timeframe.get() == MINUTE else self.timeframe.get()
 
             return parameters
 
         def performBacktest():
             """
-            This function creates a backtest object when the user
-            presses the GUI 'Execute' Button and runs the 'iterate'
-            function from the 'backtest.py' module to determine the user
-            success and profit utilizing the financial thesis for the
-            given inputs
+            This function queues a backtest when the user presses the GUI
+            'Execute' Button. The backtests run one after another on a worker
+            thread so the window stays responsive, and their results are
+            displayed by the 'poll' function
             :return:
             """
             # Retrieve parameters from GUI
             parameters = getParameters()
 
-            # Connect to the 'trading.db' database
-            connection = sqlite3.connect('trading.db')
-
-            # Create SQLite cursor
-            cursor = connection.cursor()
-
-            # Query data from the 'trading.db' SQLite database
-            data = query.readFromDB(parameters['Ticker'], parameters['Time'][0], parameters['Time'][1], cursor)
+            # Start the worker thread on the first run
+            if self.worker is None:
+                self.worker = threading.Thread(target=work, daemon=True)
+                self.worker.start()
 
-            # Construct a backtest object using 'backtest.py' module
-            self.test = backtest.Backtest(data, COLUMNS, parameters['Capital'], 0.05, parameters['Risk'], 100)
+            self.runs.put(parameters)
+            self.status.config(text="Queued " + parameters['Ticker'] + " (" + str(self.runs.qsize()) + " waiting)")
 
-            # Fill the Pandas DataFrame with indicator parameters
-            self.test.fillTable(50, 200, 9, 13, 26, 14)
-
-            # Execute the financial thesis using the 'backtest.py' module 'iterate' function
-            self.test.iterate()
-
-            # Call the 'StartPage' analysis function to display results in the GUI
-            analysis(self.test)
+        def work():
+            """
+            Worker thread loop that runs the queued backtests and
+            sends progress messages and results back to the GUI
+            :return:
+            """
+            while True:
+                parameters = self.runs.get()
+                self.cancelled.clear()
+                try:
+                    test = runBacktest(parameters, lambda message: self.messages.put(('progress', message)),
+                                       self.cancelled)
+                    self.messages.put(('done', test))
+                except Cancelled:
+                    self.messages.put(('progress', "Cancelled " + parameters['Ticker']))
+                except Exception as error:
+                    self.messages.put(('progress', "Failed " + parameters['Ticker'] + ": " + str(error)))
+
+        def cancel():
+            """
+            Cancels the backtest that is currently running
+            :return:
+            """
+            self.cancelled.set()
 
+        def poll():
+            """
+            Handles the messages from the worker thread on the TKinter
+            main thread and checks again after 'POLL_INTERVAL'
+            :return:
+            """
+            try:
+                while True:
+                    kind, content = self.messages.get_nowait()
+                    if kind == 'progress':
+                        self.status.config(text=content)
+                    else:
+                        # Call the 'StartPage' analysis function to display results in the GUI
+                        analysis(content)
+                        self.test = content
+                        print(self.test.profile.report())
+                        self.status.config(text="Finished (" + str(self.runs.qsize()) + " waiting)")
+            except queue.Empty:
+                pass
+            self.after(POLL_INTERVAL, poll)
 
         def analysis(test):
             """
@@ -202,12 +367,18 @@ class StartPage(tk.Frame):
             :param test: 'backtest.py' object created in performBacktest function
             :return:
             """
+            # Replace the labels of an earlier run
+            if self.total_profit is not None:
+                refresh()
+
             self.total_profit = tk.Label(self, text="Profit: " + str(test.total_profit), font=LARGE_FONT)
             self.total_profit.grid(row=6, column=0, pady=10, sticky="E")
             self.total_trades = tk.Label(self, text="Total Trades: " + str(test.won + test.lost), font=LARGE_FONT)
             self.total_trades.grid(row=7, column=0, pady=10, sticky="E")
             self.total_won = tk.Label(self, text="Profitable Trades: " + str(test.won), font=LARGE_FONT)
             self.total_won.grid(row=8, column=0, pady=10, sticky="E")
+            self.timings = tk.Label(self, text="Timings: " + test.profile.summary())
+            self.timings.grid(row=9, column=0, columnspan=4, pady=10, sticky="W")
 
         def refresh():
             """
@@ -220,10 +391,14 @@ class StartPage(tk.Frame):
             self.total_profit.destroy()
             self.total_trades.destroy()
             self.total_won.destroy()
+            self.timings.destroy()
 
             # Set the instance variable labels to none
             self.total_profit = None
             self.total_trades = None
             self.total_won = None
+            self.timings = None
             self.test = None
 
+        # Start checking for messages from the worker thread
+        self.after(POLL_INTERVAL, poll)
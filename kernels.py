@@ -0,0 +1,298 @@
+# Indicator Kernels File
+
+# This python file computes the indicators of 'indicators.py'
+# straight from the price array for any set of periods at once.
+# Every exponential moving average is computed a single time and
+# shared by the EMA and MACD columns, and the price differences of
+# RSI are taken once for every RSI period. With Numba installed all
+# indicators are filled in one compiled pass over the prices,
+# otherwise a vectorized NumPy version is used. Prices with
+# missing (NaN) values are computed with 'indicators.py'
+# FUNCTIONS ARE UTILIZED IN 'backtest.py'
+
+# Imports
+import sys
+import math
+import argparse
+import numpy as numpy
+import pandas as pandas
+import indicators as indicators
+
+try:
+    import numba as numba
+except ImportError:
+    numba = None
+
+# Largest exponent of the decay factor used inside one NumPy EMA block,
+# which keeps the scaled running sums far from the float64 range
+EXPONENT_LIMIT = 500.0
+
+
+def columnNames(sma=(), ema=(), macd=(), rsi=()):
+    """
+    Names the indicator arrays returned by 'compute'
+    :param sma: Simple moving average periods
+    :param ema: Exponential moving average periods
+    :param macd: (fast, slow) period pairs of the MACD
+    :param rsi: Relative strength index periods
+    :return: List of names such as 'SMA50', 'EMA9', 'MACD13_26' and 'RSI14'
+    """
+    return (['SMA' + str(period) for period in sma] + ['EMA' + str(period) for period in ema] +
+            ['MACD' + str(fast) + '_' + str(slow) for fast, slow in macd] + ['RSI' + str(period) for period in rsi])
+
+
+def rollingMean(values, period, out):
+    """
+    NumPy rolling mean matching Pandas 'rolling(window=period).mean()'. The
+    window sums are differences of one running sum, taken relative to the
+    first value so the running sum stays small
+    :param values: NumPy float array without NaN values
+    :param period: Integer window length
+    :param out: NumPy float array the means are written into
+    :return: 'out'
+    """
+    out[:period - 1] = numpy.nan
+    if len(values) < period:
+        out[:] = numpy.nan
+        return out
+    running = numpy.cumsum(values - values[0])
+    out[period - 1] = running[period - 1] / period
+    numpy.subtract(running[period:], running[:-period], out=out[period:])
+    out[period:] /= period
+    out[period - 1:] += values[0]
+    return out
+
+
+def exponentialMean(values, period, out):
+    """
+    NumPy exponential moving average matching Pandas
+    'ewm(span=period, min_periods=period).mean()'. The adjusted average of a
+    block of bars is a cumulative sum of decay weighted prices, and the
+    running totals are carried from block to block
+    :param values: NumPy float array without NaN values
+    :param period: Integer span
+    :param out: NumPy float array the averages are written into
+    :return: 'out'
+    """
+    decay = 1.0 - 2.0 / (period + 1)
+    if decay <= 0:
+        # A span of one is the price itself
+        out[:] = values
+        return out
+    block = max(1, int(EXPONENT_LIMIT / -math.log(decay)))
+    steps = numpy.arange(min(block, len(values)))
+    growth = decay ** -steps
+    shrink = decay ** (steps + 1)
+    numerator = 0.0
+    denominator = 0.0
+    for start in range(0, len(values), block):
+        chunk = values[start:start + block]
+        size = len(chunk)
+        # Sum of decay weighted prices at every bar of the block
+        weighted = numpy.cumsum(chunk * growth[:size])
+        weighted *= shrink[:size] / decay
+        weighted += numerator * shrink[:size]
+        weights = (1.0 - shrink[:size]) / (1.0 - decay) + denominator * shrink[:size]
+        numpy.divide(weighted, weights, out=out[start:start + size])
+        numerator = weighted[-1]
+        denominator = weights[-1]
+    out[:period - 1] = numpy.nan
+    return out
+
+
+def _fusedLoop(price, sma, ema, rsi, sma_out, ema_out, rsi_out):
+    """
+    Fills every SMA, EMA and RSI period in one pass over the prices.
+    Compiled with Numba when it is installed. Window sums are recomputed
+    exactly every 'period' bars so rounding errors cannot build up
+    :param price: NumPy float array without NaN values
+    :param sma: NumPy int array of SMA periods
+    :param ema: NumPy int array of EMA periods
+    :param rsi: NumPy int array of RSI periods
+    :param sma_out: 2D NumPy float array, one row per SMA period
+    :param ema_out: 2D NumPy float array, one row per EMA period
+    :param rsi_out: 2D NumPy float array, one row per RSI period
+    :return:
+    """
+    size = len(price)
+    sma_sum = numpy.zeros(len(sma))
+    ema_numerator = numpy.zeros(len(ema))
+    ema_denominator = numpy.zeros(len(ema))
+    decay = 1.0 - 2.0 / (ema + 1.0)
+    gain_sum = numpy.zeros(len(rsi))
+    loss_sum = numpy.zeros(len(rsi))
+
+    for index in range(size):
+        value = price[index]
+
+        for k in range(len(sma)):
+            period = sma[k]
+            sma_sum[k] += value
+            if index >= period:
+                sma_sum[k] -= price[index - period]
+            if index % period == period - 1:
+                # Recompute the window sum exactly
+                sma_sum[k] = 0.0
+                for back in range(index - period + 1, index + 1):
+                    sma_sum[k] += price[back]
+            sma_out[k, index] = sma_sum[k] / period if index >= period - 1 else numpy.nan
+
+        for k in range(len(ema)):
+            ema_numerator[k] = value + decay[k] * ema_numerator[k]
+            ema_denominator[k] = 1.0 + decay[k] * ema_denominator[k]
+            ema_out[k, index] = ema_numerator[k] / ema_denominator[k] if index >= ema[k] - 1 else numpy.nan
+
+        for k in range(len(rsi)):
+            period = rsi[k]
+            if index > 0:
+                change = value - price[index - 1]
+                if change > 0:
+                    gain_sum[k] += change
+                else:
+                    loss_sum[k] -= change
+            if index > period:
+                change = price[index - period] - price[index - period - 1]
+                if change > 0:
+                    gain_sum[k] -= change
+                else:
+                    loss_sum[k] += change
+            if index >= period and index % period == 0:
+                # Recompute the gains and losses of the window exactly
+                gain_sum[k] = 0.0
+                loss_sum[k] = 0.0
+                for back in range(index - period + 1, index + 1):
+                    change = price[back] - price[back - 1]
+                    if change > 0:
+                        gain_sum[k] += change
+                    else:
+                        loss_sum[k] -= change
+            if index < period:
+                rsi_out[k, index] = numpy.nan
+            elif loss_sum[k] == 0.0:
+                rsi_out[k, index] = 100.0 if gain_sum[k] > 0 else numpy.nan
+            else:
+                rsi_out[k, index] = 100.0 - 100.0 / (1.0 + gain_sum[k] / loss_sum[k])
+
+
+# Compiled kernel, or None when Numba is not installed
+_fused = numba.njit(cache=True, nogil=True)(_fusedLoop) if numba is not None else None
+
+
+def reference(price, sma=(), ema=(), macd=(), rsi=()):
+    """
+    Computes the indicators of 'compute' with the Pandas functions of
+    'indicators.py', which skip missing prices the way Pandas does
+    :param price: NumPy float array (e.g. the 'VolumeWeightPrice' column)
+    :param sma: Simple moving average periods
+    :param ema: Exponential moving average periods
+    :param macd: (fast, slow) period pairs of the MACD
+    :param rsi: Relative strength index periods
+    :return: Dictionary of 'columnNames' names and NumPy float arrays
+    """
+    frame = pandas.DataFrame({'VolumeWeightPrice': price})
+    rows = []
+    for period in sma:
+        indicators.simpleMA(frame, period)
+        rows.append(frame['SMA' + str(period)].to_numpy())
+    for period in ema:
+        indicators.exponentialMA(frame, period)
+        rows.append(frame['EMA' + str(period)].to_numpy())
+    for fast, slow in macd:
+        indicators.movingAverageConvergence(frame, fast, slow)
+        rows.append(frame['MACD'].to_numpy())
+    for period in rsi:
+        indicators.rsi(frame, period)
+        rows.append(frame['RSI'].to_numpy())
+    return dict(zip(columnNames(sma, ema, macd, rsi), rows))
+
+
+def compute(price, sma=(), ema=(), macd=(), rsi=()):
+    """
+    Computes any set of indicator periods on a price array. The kernels
+    need prices without NaN values, so prices with gaps use 'reference'
+    :param price: NumPy float array (e.g. the 'VolumeWeightPrice' column)
+    :param sma: Simple moving average periods
+    :param ema: Exponential moving average periods
+    :param macd: (fast, slow) period pairs of the MACD
+    :param rsi: Relative strength index periods
+    :return: Dictionary of 'columnNames' names and NumPy float arrays
+    """
+    price = numpy.ascontiguousarray(price, dtype=numpy.float64)
+    size = len(price)
+    sma = [int(period) for period in sma]
+    rsi = [int(period) for period in rsi]
+    if size == 0:
+        return {name: numpy.full(0, numpy.nan) for name in columnNames(sma, ema, macd, rsi)}
+    if numpy.isnan(price).any():
+        return reference(price, sma, ema, macd, rsi)
+    # Every EMA period, including the MACD ones, is computed once
+    spans = sorted(set(int(period) for period in ema) | set(int(period) for pair in macd for period in pair))
+
+    sma_out = numpy.empty((len(sma), size))
+    ema_out = numpy.empty((len(spans), size))
+    rsi_out = numpy.empty((len(rsi), size))
+    if _fused is not None:
+        _fused(price, numpy.array(sma, dtype=numpy.int64), numpy.array(spans, dtype=numpy.int64),
+               numpy.array(rsi, dtype=numpy.int64), sma_out, ema_out, rsi_out)
+    else:
+        for row, period in enumerate(sma):
+            rollingMean(price, period, sma_out[row])
+        for row, period in enumerate(spans):
+            exponentialMean(price, period, ema_out[row])
+        if rsi:
+            # One difference array, split into gains and losses in place
+            delta = numpy.diff(price, prepend=numpy.nan)
+            loss = numpy.minimum(delta, 0.0)
+            numpy.negative(loss, out=loss)
+            numpy.maximum(delta, 0.0, out=delta)
+            gains = numpy.empty(size)
+            for row, period in enumerate(rsi):
+                rollingMean(delta[1:], period, gains[1:])
+                rollingMean(loss[1:], period, rsi_out[row, 1:])
+                rsi_out[row, 0] = numpy.nan
+                with numpy.errstate(divide='ignore', invalid='ignore'):
+                    numpy.divide(gains[1:], rsi_out[row, 1:], out=rsi_out[row, 1:])
+                rsi_out[row] += 1.0
+                numpy.divide(100.0, rsi_out[row], out=rsi_out[row])
+                numpy.subtract(100.0, rsi_out[row], out=rsi_out[row])
+
+    names = columnNames(sma, ema, macd, rsi)
+    rows = list(sma_out) + [ema_out[spans.index(int(period))] for period in ema]
+    rows += [ema_out[spans.index(int(fast))] - ema_out[spans.index(int(slow))] for fast, slow in macd]
+    rows += list(rsi_out)
+    return dict(zip(names, rows))
+
+
+def parity(price, sma=(), ema=(), macd=(), rsi=(), tolerance=1e-8):
+    """
+    Compares 'compute' with the 'indicators.py' functions
+    :param price: NumPy float array
+    :param sma: Simple moving average periods
+    :param ema: Exponential moving average periods
+    :param macd: (fast, slow) period pairs of the MACD
+    :param rsi: Relative strength index periods
+    :param tolerance: Largest relative difference counted as equal
+    :return: List of the names of the indicators that do not match
+    """
+    computed = compute(price, sma, ema, macd, rsi)
+    expected = reference(price, sma, ema, macd, rsi)
+    return [name for name in expected
+            if not numpy.allclose(computed[name], expected[name], rtol=tolerance, atol=tolerance, equal_nan=True)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check the indicator kernels against 'indicators.py'")
+    parser.add_argument('--bars', type=int, default=5000, help="Number of prices in the random walk")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    arguments = parser.parse_args()
+
+    walk = 100.0 * numpy.exp(numpy.cumsum(numpy.random.default_rng(arguments.seed).normal(0, 0.001, arguments.bars)))
+    gap = walk.copy()
+    gap[len(gap) // 5] = numpy.nan
+    cases = {'clean': walk, 'gap': gap, 'empty': numpy.empty(0)}
+    failed = False
+    for case, price in cases.items():
+        mismatches = parity(price, (50, 200), (9,), ((13, 26),), (14,))
+        failed = failed or bool(mismatches)
+        print(case.ljust(10) + ("mismatch: " + ", ".join(mismatches) if mismatches else "ok"))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,160 @@
+# Trade Ledger File
+
+# This python file records every trade of a backtest in
+# one NumPy structured array instead of a Python object per
+# trade, and computes the summary statistics of the trades
+# with vectorized NumPy functions
+# FUNCTIONS ARE UTILIZED IN 'backtest.py'
+
+# Imports
+import numpy as numpy
+import pandas as pandas
+
+# Exit reasons of a trade
+STOP = 1
+SIGNAL = 2
+REASONS = {STOP: 'stop', SIGNAL: 'signal'}
+
+# Record layout of one trade, 49 bytes
+TRADE = numpy.dtype([('entry', numpy.int64), ('exit', numpy.int64), ('entry_price', numpy.float64),
+                     ('exit_price', numpy.float64), ('shares', numpy.float64), ('profit', numpy.float64),
+                     ('reason', numpy.int8)])
+
+# Initial number of trade records allocated
+CAPACITY = 64
+
+
+class TradeLedger:
+    """
+    This class holds the closed trades of a backtest. Trades are written
+    into a preallocated structured array that doubles when it is full, so
+    a trade costs one fixed size record. Iterating the ledger gives
+    (entry index, exit index, entry price, exit price, shares, profit)
+    tuples, the same layout as the former list ledger
+    """
+    __slots__ = ('records', 'size')
+
+    def __init__(self, capacity=CAPACITY):
+        """
+        Constructs an empty ledger
+
+        :param capacity: Number of trade records allocated up front
+        """
+        self.records = numpy.empty(max(capacity, 1), dtype=TRADE)
+        self.size = 0
+
+    def append(self, entry, leave, entry_price, exit_price, shares, reason):
+        """
+        Records a closed trade
+        :param entry: Integer row index of the entrance
+        :param leave: Integer row index of the exit
+        :param entry_price: Float entrance price
+        :param exit_price: Float exit price
+        :param shares: Number of shares held
+        :param reason: Exit reason ('STOP' or 'SIGNAL')
+        :return:
+        """
+        if self.size == len(self.records):
+            records = numpy.empty(2 * len(self.records), dtype=TRADE)
+            records[:self.size] = self.records
+            self.records = records
+        self.records[self.size] = (entry, leave, entry_price, exit_price, shares,
+                                   (exit_price - entry_price) * shares, reason)
+        self.size += 1
+
+    @classmethod
+    def fromTrades(cls, trades):
+        """
+        Constructs a ledger holding a copy of recorded trades
+        :param trades: 'TRADE' structured array
+        :return: 'TradeLedger' object
+        """
+        filled = cls(len(trades))
+        filled.records[:len(trades)] = trades
+        filled.size = len(trades)
+        return filled
+
+    @property
+    def trades(self):
+        """
+        :return: Structured array view of the recorded trades
+        """
+        return self.records[:self.size]
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        trades = self.trades
+        return zip(trades['entry'].tolist(), trades['exit'].tolist(), trades['entry_price'].tolist(),
+                   trades['exit_price'].tolist(), trades['shares'].tolist(), trades['profit'].tolist())
+
+    def returns(self):
+        """
+        :return: NumPy array of the return of every trade on its investment
+        """
+        trades = self.trades
+        invested = trades['entry_price'] * trades['shares']
+        return numpy.divide(trades['profit'], invested, out=numpy.zeros(len(trades)), where=invested != 0)
+
+    def winRate(self):
+        """
+        :return: Fraction of the trades that were profitable
+        """
+        if not self.size:
+            return 0.0
+        return float(numpy.count_nonzero(self.trades['profit'] > 0)) / self.size
+
+    def drawdown(self, capital):
+        """
+        Finds the largest fall of the closed trade equity from its peak
+        :param capital: Starting capital of the backtest
+        :return: Maximum drawdown as a fraction of the peak equity
+        """
+        equity = capital + numpy.concatenate(([0.0], numpy.cumsum(self.trades['profit'])))
+        peak = numpy.maximum.accumulate(equity)
+        falls = numpy.divide(peak - equity, peak, out=numpy.zeros(len(equity)), where=peak > 0)
+        return float(falls.max())
+
+    def sharpe(self, periods=1):
+        """
+        Sharpe ratio of the trade returns, with no risk free rate
+        :param periods: Number of trades per year used to annualize the
+        ratio (1 leaves it per trade)
+        :return: Float Sharpe ratio, 0 with fewer than two trades
+        """
+        returns = self.returns()
+        if len(returns) < 2:
+            return 0.0
+        deviation = returns.std(ddof=1)
+        if deviation == 0:
+            return 0.0
+        return float(returns.mean() / deviation * numpy.sqrt(periods))
+
+    def exposure(self, bars):
+        """
+        :param bars: Number of bars in the backtest
+        :return: Fraction of the bars spent in a position
+        """
+        if not bars:
+            return 0.0
+        trades = self.trades
+        return float(numpy.sum(trades['exit'] - trades['entry'] + 1)) / bars
+
+    def summary(self, capital, bars):
+        """
+        Computes every summary statistic of the ledger
+        :param capital: Starting capital of the backtest
+        :param bars: Number of bars in the backtest
+        :return: Dictionary of win rate, drawdown, Sharpe ratio and exposure
+        """
+        return {'win_rate': self.winRate(), 'drawdown': self.drawdown(capital),
+                'sharpe': self.sharpe(), 'exposure': self.exposure(bars)}
+
+    def toFrame(self):
+        """
+        :return: Pandas DataFrame of the trades with readable exit reasons
+        """
+        frame = pandas.DataFrame(self.trades)
+        frame['reason'] = frame['reason'].map(REASONS)
+        return frame
@@ -0,0 +1,165 @@
+# Portfolio Backtest File
+
+# This python file runs the financial thesis over a
+# list of tickers at once and combines the trades into
+# portfolio level results that share one pool of capital
+
+# Imports
+import argparse
+import concurrent.futures
+import numpy as numpy
+import pandas as pandas
+import backtest as backtest
+import query as query
+import datasource as datasource
+import sweep as sweep
+
+# The 25 ticker symbols listed in the 'gui.py' StartPage
+TICKERS = ['CVX', 'XOM', 'GE', 'LMT', 'AMZN', 'HD', 'PEP', 'MMM', 'JNJ', 'UNH', 'GS', 'MS', 'GOOGL',
+           'ITNC', 'VZ', 'CMCSA', 'DUK', 'D', 'SPG', 'AMT', 'WRK', 'AA', 'TSLA', 'AAPL', 'JPM']
+
+
+def runTicker(ticker, data, capital, config):
+    """
+    Backtests one ticker of the portfolio and timestamps its trades
+    :param ticker: String ticker symbol (e.g. AAPL)
+    :param data: Dictionary of column arrays for the ticker
+    :param capital: Integer Amount of capital used in back testing the thesis
+    :param config: Configuration dictionary (see 'sweep.DEFAULTS')
+    :return: Tuple of the ticker summary dictionary and a list of trade tuples
+    (entry date, entry time, exit date, exit time, ticker, entry price, exit price)
+    """
+    test = backtest.Backtest(data, query.COLUMNS, capital, config['stop_loss'], config['percentage'],
+                             100, config['confirmation'], lean=True)
+    test.fillTable(config['sma_fast'], config['sma_slow'], config['ema'],
+                   config['macd_fast'], config['macd_slow'], config['rsi_period'])
+    test.vectorIterate()
+
+    dates = test.df['Date'].to_numpy()
+    times = test.df['TimeBarStart'].to_numpy()
+    trades = [(int(dates[entry]), int(times[entry]), int(dates[leave]), int(times[leave]),
+               ticker, entry_price, exit_price)
+              for entry, leave, entry_price, exit_price, shares, profit in test.ledger]
+
+    summary = {'Ticker': ticker, 'total_profit': test.total_profit, 'won': test.won,
+               'lost': test.lost, 'trades': test.trades}
+    return summary, trades
+
+
+class Portfolio:
+    """
+    This class runs the financial thesis of the 'backtest.py' module over
+    several tickers. Every ticker is backtested on its own in a process pool
+    to find its trades, and the trades of all tickers are then replayed in
+    time order against one shared pool of capital, so each entry is sized
+    from the capital that is actually free at that moment
+    """
+
+    def __init__(self, tickers, capital, config=None):
+        """
+        Constructs a portfolio object to run the 'load' and 'run' functions
+
+        :param tickers: List of string ticker symbols (defaults to 'TICKERS')
+        :param capital: Integer Amount of capital shared by all tickers
+        :param config: Configuration dictionary (defaults to 'sweep.DEFAULTS')
+        """
+        self.tickers = list(tickers or TICKERS)
+        self.capital = capital
+        self.config = dict(config or sweep.DEFAULTS)
+        self.data = {}
+        self.results = None
+        self.ledger = None
+        self.total_profit = 0.00
+        self.won = 0
+        self.lost = 0
+        self.trades = 0
+
+    def load(self, start, end, cursor, session=None, timeframe=None):
+        """
+        Loads every ticker of the portfolio in one batched query
+        :param start: Integer starting date
+        :param end: Integer ending date
+        :param cursor: SQLite cursor
+        :param session: Optional (start, end) HHMM session tuple
+        :param timeframe: Optional 'timeframes.py' label of the rollup bars to load
+        :return:
+        """
+        self.data = query.readTickers(self.tickers, start, end, cursor, session, timeframe=timeframe)
+
+    def run(self, workers=None):
+        """
+        Backtests the tickers concurrently and replays their trades
+        against the shared capital
+        :param workers: Number of worker processes (defaults to the CPU count)
+        :return: Total profit of the portfolio
+        """
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(runTicker, ticker, self.data[ticker], self.capital, self.config)
+                       for ticker in self.tickers if len(self.data[ticker]['Date'])]
+            outcomes = [future.result() for future in futures]
+
+        self.results = pandas.DataFrame([summary for summary, trades in outcomes],
+                                        columns=['Ticker', 'total_profit', 'won', 'lost', 'trades'])
+        self.replay([trade for summary, trades in outcomes for trade in trades])
+        return self.total_profit
+
+    def replay(self, trades):
+        """
+        Replays timestamped trades in time order with one pool of capital.
+        Exits are processed before entries at the same bar, and an entry is
+        skipped if the free capital cannot buy a single share
+        :param trades: List of trade tuples from 'runTicker'
+        :return:
+        """
+        events = []
+        for number, (entry_date, entry_time, exit_date, exit_time, ticker, entry_price, exit_price) in enumerate(trades):
+            events.append((entry_date, entry_time, 1, number))
+            events.append((exit_date, exit_time, 0, number))
+        events.sort()
+
+        cash = self.capital
+        shares = {}
+        rows = []
+        for date, time, entering, number in events:
+            entry_date, entry_time, exit_date, exit_time, ticker, entry_price, exit_price = trades[number]
+            if entering:
+                count = (cash * self.config['percentage'])//entry_price
+                if count > 0:
+                    shares[number] = count
+                    cash -= entry_price * count
+            elif number in shares:
+                count = shares.pop(number)
+                cash += exit_price * count
+                rows.append(trades[number] + (count, (exit_price - entry_price) * count))
+
+        self.ledger = pandas.DataFrame(rows, columns=['EntryDate', 'EntryTime', 'ExitDate', 'ExitTime', 'Ticker',
+                                                      'EntryPrice', 'ExitPrice', 'Shares', 'Profit'])
+        profit = self.ledger['Profit'].to_numpy()
+        self.total_profit = round(float(numpy.sum(profit)), 2)
+        self.won = int(numpy.sum(profit > 0))
+        self.lost = int(numpy.sum(profit < 0))
+        self.trades = len(profit)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Backtest the financial thesis over a portfolio of tickers")
+    parser.add_argument('start', type=int, help="Starting date (e.g. 20150514)")
+    parser.add_argument('end', type=int, help="Ending date (e.g. 20150527)")
+    parser.add_argument('--tickers', nargs='*', default=None, help="Ticker symbols (defaults to all 25)")
+    parser.add_argument('--capital', type=int, default=1000000, help="Amount of capital shared by all tickers")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes")
+    parser.add_argument('--output', default=None, help="CSV file for the portfolio trades")
+    parser.add_argument('--timeframe', default=None, help="Rollup bar timeframe (e.g. 15m) instead of minute bars")
+    arguments = parser.parse_args()
+
+    portfolio = Portfolio(arguments.tickers, arguments.capital)
+    with datasource.pool(immutable=True).acquire() as connection:
+        portfolio.load(arguments.start, arguments.end, connection.cursor(), timeframe=arguments.timeframe)
+
+    portfolio.run(arguments.workers)
+    print(portfolio.results.to_string(index=False))
+    print("Portfolio Profit: " + str(portfolio.total_profit))
+    print("Total Trades: " + str(portfolio.won + portfolio.lost))
+    print("Profitable Trades: " + str(portfolio.won))
+    if arguments.output is not None:
+        portfolio.ledger.to_csv(arguments.output, index=False)
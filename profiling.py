@@ -0,0 +1,142 @@
+# Profiling File
+
+# This python file times the stages of the backtest
+# pipeline (query, DataFrame construction, indicators
+# and the iterate loop) and counts the rows and trades
+# processed, with optional cProfile and tracemalloc capture
+# CLASSES ARE UTILIZED IN 'backtest.py' and 'gui.py'
+
+# Imports
+import io
+import functools
+import time
+import pstats
+import cProfile
+import contextlib
+import tracemalloc
+
+
+class Profiler:
+    """
+    This class collects the time spent in each named stage and a set of
+    counters. Stages are timed with the 'stage' context manager. A disabled
+    profiler hands out one shared empty context manager, so instrumented code
+    costs only a method call per stage when profiling is turned off
+    """
+
+    def __init__(self, enabled=True, cprofile=False, memory=False):
+        """
+        Constructs a profiler
+
+        :param enabled: Boolean value for whether or not stages are timed
+        :param cprofile: Boolean value for whether or not the stages
+        are also captured with cProfile
+        :param memory: Boolean value for whether or not the peak
+        memory of every stage is traced with tracemalloc
+        """
+        self.enabled = enabled
+        self.timings = {}
+        self.counters = {}
+        self.peaks = {}
+        self.profile = cProfile.Profile() if enabled and cprofile else None
+        self.memory = enabled and memory
+        self.disabled = contextlib.nullcontext()
+        self.depth = 0
+
+    def stage(self, name):
+        """
+        Times a stage of the pipeline, adding to any earlier time of the same name
+        :param name: String stage name
+        :return: Context manager
+        """
+        if not self.enabled:
+            return self.disabled
+        return self.timed(name)
+
+    @contextlib.contextmanager
+    def timed(self, name):
+        """
+        Context manager behind 'stage' for an enabled profiler. Stages may
+        be nested, the cProfile and tracemalloc capture runs for the
+        outermost stage only, so the peak memory is that of the outer stage
+        :param name: String stage name
+        :return:
+        """
+        outer = self.depth == 0
+        self.depth += 1
+        tracing = outer and self.memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif outer and self.memory:
+            tracemalloc.reset_peak()
+        if outer and self.profile is not None:
+            self.profile.enable()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - started
+            self.depth -= 1
+            if outer and self.profile is not None:
+                self.profile.disable()
+            if outer and self.memory:
+                self.peaks[name] = max(self.peaks.get(name, 0), tracemalloc.get_traced_memory()[1])
+            if tracing:
+                tracemalloc.stop()
+
+    def count(self, name, value):
+        """
+        Adds to a counter (e.g. rows or trades)
+        :param name: String counter name
+        :param value: Integer amount
+        :return:
+        """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self, top=15):
+        """
+        Formats the collected timings, counters and peaks
+        :param top: Number of cProfile functions to include
+        :return: String report
+        """
+        lines = []
+        for name, seconds in self.timings.items():
+            line = name.ljust(14) + (str(round(seconds, 4)) + " s").rjust(12)
+            if name in self.peaks:
+                line += (str(self.peaks[name] // 1024) + " KiB").rjust(14)
+            lines.append(line)
+        for name, value in self.counters.items():
+            lines.append(name.ljust(14) + str(value).rjust(12))
+        if self.profile is not None:
+            stream = io.StringIO()
+            pstats.Stats(self.profile, stream=stream).sort_stats('cumulative').print_stats(top)
+            lines.append(stream.getvalue())
+        return "\n".join(lines)
+
+    def summary(self):
+        """
+        Formats the stage timings on one line for display in the GUI
+        :return: String summary
+        """
+        return ", ".join(name + " " + str(round(seconds, 3)) + "s" for name, seconds in self.timings.items())
+
+
+# Profiler used when none is given, which records nothing
+DISABLED = Profiler(enabled=False)
+
+
+def staged(name):
+    """
+    Decorator that times a method as a stage of the profiler
+    stored in the 'profile' attribute of its object
+    :param name: String stage name
+    :return: Method decorator
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def timed(self, *args, **kwargs):
+            with self.profile.stage(name):
+                return method(self, *args, **kwargs)
+        return timed
+    return decorate
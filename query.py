@@ -4,7 +4,73 @@
 # to retrieve data from 'trading.db'
 # for back testing the financial thesis
 
-def readFromDB(ticker, start, end, cursor):
+# Imports
+import numpy as numpy
+import sessions as sessions
+
+
+# Column labels of the 'Algo_Trading' table
+COLUMNS = ['Date', 'Ticker', 'TimeBarStart','FirstTradePrice', 'HighTradePrice', 'LowTradePrice',
+          'LastTradePrice', 'VolumeWeightPrice', 'Volume', 'TotalTrades']
+
+# Typed NumPy column types used by 'readArrays'. 'Ticker' is implied by
+# the query and 'TimeBarStart' becomes an HHMM integer, which 'removeData' understands
+DTYPES = {'Date': numpy.int32, 'TimeBarStart': numpy.int16, 'FirstTradePrice': numpy.float64,
+          'HighTradePrice': numpy.float64, 'LowTradePrice': numpy.float64,
+          'LastTradePrice': numpy.float64, 'VolumeWeightPrice': numpy.float64,
+          'Volume': numpy.int64, 'TotalTrades': numpy.int32}
+
+# Table of the one minute bars, the 'timeframes.py' rollup tables add a suffix
+TABLE = 'Algo_Trading'
+
+# Rows fetched from SQLite per chunk
+FETCH_SIZE = 20000
+
+# Memory map and page cache sizes for read connections
+MMAP_SIZE = 1 << 30
+CACHE_SIZE = -65536
+
+
+def tuneConnection(connection):
+    """
+    Applies the per connection read pragmas so repeated
+    queries are served from memory mapped pages
+    :param connection: SQLite connection
+    :return:
+    """
+    connection.execute('PRAGMA mmap_size=' + str(MMAP_SIZE))
+    connection.execute('PRAGMA cache_size=' + str(CACHE_SIZE))
+
+
+def tableName(timeframe=None):
+    """
+    Names the table holding the bars of a timeframe
+    :param timeframe: Optional 'timeframes.TIMEFRAMES' label (e.g. '15m'),
+    None for the one minute bars
+    :return: String table name
+    """
+    if timeframe is None:
+        return TABLE
+    return TABLE + '_' + timeframe
+
+
+def buildQuery(session=None, select='*', timeframe=None):
+    """
+    Builds the backtest query used by 'readFromDB'. The filter and order
+    match the (Ticker, Date, TimeBarStart) index created in 'database.py'
+    :param session: Optional (start, end) HHMM session tuple
+    :param select: Selected columns or expression
+    :param timeframe: Optional 'timeframes.TIMEFRAMES' label of a rollup table
+    :return: Tuple of the SQL string and the extra session parameters
+    """
+    table = tableName(timeframe)
+    if session is None:
+        return 'SELECT ' + select + ' FROM ' + table + ' WHERE Ticker=? AND Date>=? AND DATE<=? ORDER BY Date ASC', ()
+    clause, bounds = sessions.sessionClause(*session)
+    return 'SELECT ' + select + ' FROM ' + table + ' WHERE Ticker=? AND Date>=? AND DATE<=? AND ' + clause + ' ORDER BY Date ASC', bounds
+
+
+def readFromDB(ticker, start, end, cursor, session=None, timeframe=None):
     """
     This function queries a specific dataset from the
     'trading.db' SQLite database based on user inputs in
@@ -15,10 +81,129 @@ def readFromDB(ticker, start, end, cursor):
     :param start: Integer starting date
     :param end: Integer ending date
     :param cursor: SQLite cursor
+    :param session: Optional (start, end) HHMM tuple, e.g. (930, 1600),
+    to filter pre-market and post-market rows inside the query
+    :param timeframe: Optional 'timeframes.TIMEFRAMES' label to read the
+    rollup bars of that timeframe instead of the one minute bars
     :return:
     """
-    cursor.execute('SELECT * FROM Algo_Trading WHERE Ticker=? AND Date>=? AND DATE<=? ORDER BY Date ASC', (ticker, start, end))
+    sql, bounds = buildQuery(session, timeframe=timeframe)
+    cursor.execute(sql, (ticker, start, end) + bounds)
     data = cursor.fetchall()
     return data
 
 
+def readChunks(ticker, start, end, cursor, session=None, chunksize=FETCH_SIZE, timeframe=None):
+    """
+    Generator version of 'readFromDB' that fetches the query in chunks with
+    'fetchmany' and yields each chunk as typed NumPy arrays, so only
+    'chunksize' Python tuples are alive at any time
+
+    :param ticker: String ticker symbol (e.g. AAPL)
+    :param start: Integer starting date
+    :param end: Integer ending date
+    :param cursor: SQLite cursor
+    :param session: Optional (start, end) HHMM session tuple
+    :param chunksize: Number of rows per chunk
+    :param timeframe: Optional 'timeframes.TIMEFRAMES' label of a rollup table
+    :return: Dictionaries of 'DTYPES' column labels and NumPy arrays
+    """
+    sql, bounds = buildQuery(session, ', '.join(DTYPES), timeframe)
+    cursor.execute(sql, (ticker, start, end) + bounds)
+    while True:
+        rows = cursor.fetchmany(chunksize)
+        if not rows:
+            break
+        chunk = {}
+        for (column, dtype), values in zip(DTYPES.items(), zip(*rows)):
+            if column == 'TimeBarStart':
+                chunk[column] = sessions.toHHMM(sessions.minutesOfDay(values))
+            else:
+                chunk[column] = numpy.array(values, dtype=dtype)
+        yield chunk
+
+
+def readArrays(ticker, start, end, cursor, session=None, chunksize=FETCH_SIZE, timeframe=None):
+    """
+    Reads the same rows as 'readFromDB' into typed NumPy arrays that can be
+    passed to 'Backtest' in place of the list of tuples. The row count is
+    queried first so every column is allocated once and filled chunk by
+    chunk. Peak memory is bounded by the final arrays (58 bytes per row plus
+    8 for the 'Ticker' column) and one chunk of tuples (about 500 bytes per
+    row, so roughly 10 MB at the default chunk size) and does not depend on
+    the date range, where 'readFromDB' needs about 400 bytes per row
+
+    :param ticker: String ticker symbol (e.g. AAPL)
+    :param start: Integer starting date
+    :param end: Integer ending date
+    :param cursor: SQLite cursor
+    :param session: Optional (start, end) HHMM session tuple
+    :param chunksize: Number of rows per chunk
+    :param timeframe: Optional 'timeframes.TIMEFRAMES' label of a rollup table
+    :return: Dictionary of column labels and NumPy arrays
+    """
+    sql, bounds = buildQuery(session, 'COUNT(*)', timeframe)
+    cursor.execute(sql, (ticker, start, end) + bounds)
+    size = cursor.fetchone()[0]
+
+    data = {column: numpy.empty(size, dtype=dtype) for column, dtype in DTYPES.items()}
+    filled = 0
+    for chunk in readChunks(ticker, start, end, cursor, session, chunksize, timeframe):
+        # Rows inserted between the count and the read are left out
+        length = min(len(chunk['Date']), size - filled)
+        for column, values in chunk.items():
+            data[column][filled:filled + length] = values[:length]
+        filled += length
+
+    data = {column: values[:filled] for column, values in data.items()}
+    data['Ticker'] = numpy.full(filled, ticker, dtype=object)
+    return data
+
+
+def readTickers(tickers, start, end, cursor, session=None, chunksize=FETCH_SIZE, timeframe=None):
+    """
+    Reads several tickers in one batched query. The rows come back grouped
+    by ticker in date order straight from the (Ticker, Date, TimeBarStart)
+    index and are converted chunk by chunk like 'readChunks'
+
+    :param tickers: List of string ticker symbols
+    :param start: Integer starting date
+    :param end: Integer ending date
+    :param cursor: SQLite cursor
+    :param session: Optional (start, end) HHMM session tuple
+    :param chunksize: Number of rows per chunk
+    :param timeframe: Optional 'timeframes.TIMEFRAMES' label of a rollup table
+    :return: Dictionary of ticker symbols and dictionaries of column arrays
+    """
+    sql = ('SELECT Ticker, ' + ', '.join(DTYPES) + ' FROM ' + tableName(timeframe) + ' WHERE Ticker IN (' +
+           ', '.join('?' * len(tickers)) + ') AND Date>=? AND Date<=?')
+    bounds = ()
+    if session is not None:
+        clause, bounds = sessions.sessionClause(*session)
+        sql += ' AND ' + clause
+    cursor.execute(sql + ' ORDER BY Ticker ASC, Date ASC', tuple(tickers) + (start, end) + bounds)
+
+    chunks = {ticker: [] for ticker in tickers}
+    while True:
+        rows = cursor.fetchmany(chunksize)
+        if not rows:
+            break
+        columns = list(zip(*rows))
+        symbols = numpy.array(columns[0], dtype=object)
+        chunk = {}
+        for (column, dtype), values in zip(DTYPES.items(), columns[1:]):
+            if column == 'TimeBarStart':
+                chunk[column] = sessions.toHHMM(sessions.minutesOfDay(values))
+            else:
+                chunk[column] = numpy.array(values, dtype=dtype)
+        # Split the chunk where the ticker changes
+        changes = numpy.flatnonzero(symbols[1:] != symbols[:-1]) + 1
+        for first, last in zip(numpy.r_[0, changes], numpy.r_[changes, len(symbols)]):
+            chunks[symbols[first]].append({column: values[first:last] for column, values in chunk.items()})
+
+    data = {}
+    for ticker, pieces in chunks.items():
+        data[ticker] = {column: numpy.concatenate([piece[column] for piece in pieces]) if pieces
+                        else numpy.empty(0, dtype=dtype) for column, dtype in DTYPES.items()}
+        data[ticker]['Ticker'] = numpy.full(len(data[ticker]['Date']), ticker, dtype=object)
+    return data
@@ -0,0 +1,212 @@
+# Replay File
+
+# This python file replays 'Algo_Trading' rows from 'trading.db'
+# as an asyncio event stream in (Date, TimeBarStart) order across
+# tickers and runs the financial thesis one bar at a time, the way
+# it would run live. The time taken for every bar decision is
+# recorded to report the decision latency
+
+# Imports
+import time
+import argparse
+import asyncio
+import numpy as numpy
+import backtest as backtest
+import ledger as ledger
+import query as query
+import datasource as datasource
+import sessions as sessions
+import signals as signals
+import streaming as streaming
+import sweep as sweep
+
+# Bars buffered between the reader and the strategy
+QUEUE_SIZE = 10000
+
+
+class Trader:
+    """
+    This class runs the financial thesis for one ticker bar by bar. The
+    indicators come from the 'streaming.py' module, the signals from the
+    'signals.py' module and the trade accounting from the 'Backtest'
+    'takePosition' and 'leavePosition' functions, following the same
+    steps as the 'iterate' function
+    """
+
+    def __init__(self, ticker, capital, config):
+        """
+        :param ticker: String ticker symbol (e.g. AAPL)
+        :param capital: Integer Amount of capital used in back testing the thesis
+        :param config: Configuration dictionary (see 'sweep.DEFAULTS')
+        """
+        self.ticker = ticker
+        self.test = backtest.Backtest([], query.COLUMNS, capital, config['stop_loss'], config['percentage'],
+                                      100, config['confirmation'])
+        self.indicators = streaming.IndicatorSet(config['sma_fast'], config['sma_slow'], config['ema'],
+                                                 config['macd_fast'], config['macd_slow'], config['rsi_period'])
+        self.sma_fast = "SMA" + str(config['sma_fast'])
+        self.sma_slow = "SMA" + str(config['sma_slow'])
+        self.period = 0
+        self.bars = 0
+        self.entry_index = None
+        self.exit_price = None
+
+    def onBar(self, column):
+        """
+        Updates the indicators with a new bar and enters or
+        leaves a position when the signals are met
+        :param column: Dictionary of 'query.COLUMNS' labels and bar values
+        :return:
+        """
+        column.update(self.indicators.update(column['VolumeWeightPrice']))
+        test = self.test
+
+        # Check if technical indicator signals have identified an entrance position
+        if signals.positionEntrance(column[self.sma_slow], column[self.sma_fast], column['MACD'], column['RSI']):
+            self.period += 1
+            # If signals have been confirmed and currently not in a position, enter the position
+            if not test.inPosition and self.period >= test.confirmation:
+                test.takePosition(column)
+                self.entry_index = self.bars
+                # Create stop loss value
+                self.exit_price = column['VolumeWeightPrice'] * (1.0 - test.stop_loss)
+            if test.inPosition:
+                test.current = column['VolumeWeightPrice']
+                test.roi = test.current * test.shares
+
+        # Check if technical indicator signals have identified an exit position
+        if test.inPosition:
+            stopped = self.exit_price >= column['VolumeWeightPrice']
+            if stopped or signals.positionExit(column['MACD'], column['RSI']):
+                test.current = column['VolumeWeightPrice']
+                test.roi = test.current * test.shares
+                test.ledger.append(self.entry_index, self.bars, test.entrance, test.current, test.shares,
+                                   ledger.STOP if stopped else ledger.SIGNAL)
+                test.leavePosition(column)
+                self.period = 0
+        self.bars += 1
+
+
+class Replay:
+    """
+    This class streams bars from 'trading.db' through an asyncio queue
+    to one 'Trader' per ticker. With no speed the bars are replayed as
+    fast as possible, otherwise the market clock is scaled to wall clock
+    time (e.g. a speed of 60 plays one market minute per second), with the
+    gaps between trading days left out
+    """
+
+    def __init__(self, tickers, start, end, capital, config=None, speed=None, session=None):
+        """
+        :param tickers: List of string ticker symbols
+        :param start: Integer starting date
+        :param end: Integer ending date
+        :param capital: Integer Amount of capital used for each ticker
+        :param config: Configuration dictionary (defaults to 'sweep.DEFAULTS')
+        :param speed: Optional float market seconds replayed per wall clock second
+        :param session: Optional (start, end) HHMM session tuple
+        """
+        self.tickers = list(tickers)
+        self.start = start
+        self.end = end
+        self.speed = speed
+        self.session = session
+        config = dict(config or sweep.DEFAULTS)
+        self.traders = {ticker: Trader(ticker, capital, config) for ticker in self.tickers}
+        self.latencies = []
+
+    async def produce(self, cursor, bars):
+        """
+        Reads the bars in (Date, TimeBarStart) order and puts them on the
+        queue, pacing them when a speed is set. 'None' marks the end
+        :param cursor: SQLite cursor
+        :param bars: asyncio Queue
+        :return:
+        """
+        sql = ('SELECT * FROM Algo_Trading WHERE Ticker IN (' + ', '.join('?' * len(self.tickers)) +
+               ') AND Date>=? AND Date<=?')
+        bounds = ()
+        if self.session is not None:
+            clause, bounds = sessions.sessionClause(*self.session)
+            sql += ' AND ' + clause
+        cursor.execute(sql + ' ORDER BY Date ASC, TimeBarStart ASC', tuple(self.tickers) + (self.start, self.end) + bounds)
+
+        started = time.perf_counter()
+        clock = 0.0
+        previous = None
+        while True:
+            rows = cursor.fetchmany(query.FETCH_SIZE)
+            if not rows:
+                break
+            minutes = sessions.minutesOfDay([row[2] for row in rows])
+            for row, minute in zip(rows, minutes.tolist()):
+                if self.speed is not None:
+                    # Advance the market clock, counting a new day as one minute
+                    stamp = (row[0], minute)
+                    if previous is not None and stamp != previous:
+                        clock += 60.0 * (minute - previous[1] if stamp[0] == previous[0] else 1)
+                    previous = stamp
+                    delay = started + clock / self.speed - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                await bars.put(dict(zip(query.COLUMNS, row)))
+        await bars.put(None)
+
+    async def consume(self, bars):
+        """
+        Takes bars off the queue and hands them to their ticker's
+        'Trader', timing every decision
+        :param bars: asyncio Queue
+        :return:
+        """
+        while True:
+            column = await bars.get()
+            if column is None:
+                break
+            began = time.perf_counter()
+            self.traders[column['Ticker']].onBar(column)
+            self.latencies.append(time.perf_counter() - began)
+
+    async def run(self, cursor):
+        """
+        Replays the bars and waits until every bar has been processed
+        :param cursor: SQLite cursor
+        :return:
+        """
+        bars = asyncio.Queue(QUEUE_SIZE)
+        await asyncio.gather(self.produce(cursor, bars), self.consume(bars))
+        for trader in self.traders.values():
+            trader.test.total_profit = round(trader.test.total_profit, 2)
+
+    def latency(self):
+        """
+        Summarizes the per bar decision latency
+        :return: Dictionary of bar count and p50, p99 and maximum latency in microseconds
+        """
+        if not self.latencies:
+            return {'bars': 0, 'p50': 0.0, 'p99': 0.0, 'max': 0.0}
+        values = numpy.array(self.latencies) * 1e6
+        return {'bars': len(values), 'p50': float(numpy.percentile(values, 50)),
+                'p99': float(numpy.percentile(values, 99)), 'max': float(values.max())}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay 'trading.db' bars through the financial thesis")
+    parser.add_argument('start', type=int, help="Starting date (e.g. 20150514)")
+    parser.add_argument('end', type=int, help="Ending date (e.g. 20150527)")
+    parser.add_argument('--tickers', nargs='+', required=True, help="Ticker symbols")
+    parser.add_argument('--capital', type=int, default=1000000, help="Amount of capital for each ticker")
+    parser.add_argument('--speed', type=float, default=None,
+                        help="Market seconds per wall clock second (as fast as possible if left out)")
+    arguments = parser.parse_args()
+
+    replay = Replay(arguments.tickers, arguments.start, arguments.end, arguments.capital, speed=arguments.speed)
+    with datasource.pool().acquire() as connection:
+        asyncio.run(replay.run(connection.cursor()))
+
+    for ticker, trader in replay.traders.items():
+        print(ticker + " Profit: " + str(trader.test.total_profit) + " Total Trades: " +
+              str(trader.test.won + trader.test.lost) + " Profitable Trades: " + str(trader.test.won))
+    stats = replay.latency()
+    print("Bars: " + str(stats['bars']) + " Decision latency p50: " + str(round(stats['p50'], 1)) +
+          " us p99: " + str(round(stats['p99'], 1)) + " us max: " + str(round(stats['max'], 1)) + " us")
@@ -0,0 +1,253 @@
+# Results File
+
+# This python file keeps every backtest run in its own SQLite
+# database, 'results.db'. A run is stored under a hash of its
+# parameters and a fingerprint of the bars it read, so running
+# an identical configuration on unchanged data returns the
+# stored metrics and trade ledger instead of backtesting again,
+# and past runs can be listed and compared
+# FUNCTIONS ARE UTILIZED IN 'gui.py' and 'cli.py'
+
+# Imports
+import json
+import time
+import hashlib
+import argparse
+import contextlib
+import sqlite3 as sqlite3
+import numpy as numpy
+import pandas as pandas
+import query as query
+import ledger as ledger
+import backtest as backtest
+import sweep as sweep
+
+# Default results database file
+PATH = 'results.db'
+
+# Version of the backtest results, increase it when a change to the
+# engine alters the results so earlier runs are no longer reused
+VERSION = 1
+
+# Aggregates of the queried bars that make up the data fingerprint
+FINGERPRINT = ('COUNT(*), MIN(Date), MAX(Date), TOTAL(Volume), TOTAL(VolumeWeightPrice), '
+               'TOTAL(HighTradePrice - LowTradePrice)')
+
+# Metrics stored as integers, the other 'sweep.RESULTS' metrics are floats
+COUNTS = ['won', 'lost', 'trades']
+
+# Columns of a run besides its 'sweep.RESULTS' metrics
+RUN = ['key', 'created', 'ticker', 'start_date', 'end_date', 'timeframe', 'capital', 'parameters', 'fingerprint']
+
+
+def fingerprint(cursor, ticker, start, end, session=None, timeframe=None):
+    """
+    Summarizes the bars a backtest reads without loading them. Newly
+    ingested or rebuilt bars change the row count or one of the sums
+    :param cursor: SQLite cursor of 'trading.db'
+    :param ticker: String ticker symbol (e.g. AAPL)
+    :param start: Integer starting date
+    :param end: Integer ending date
+    :param session: Optional (start, end) HHMM session tuple
+    :param timeframe: Optional 'timeframes.TIMEFRAMES' label of a rollup table
+    :return: String hex digest
+    """
+    sql, bounds = query.buildQuery(session, FINGERPRINT, timeframe)
+    cursor.execute(sql, (ticker, start, end) + bounds)
+    return hashlib.sha1(repr(cursor.fetchone()).encode()).hexdigest()
+
+
+def runKey(parameters, digest):
+    """
+    Hashes the inputs of a run. Parameters set to None are left out,
+    so a missing rule or timeframe and an empty one give the same key
+    :param parameters: Dictionary of 'ticker', 'start', 'end', 'capital',
+    'timeframe' and the configuration (see 'sweep.DEFAULTS')
+    :param digest: String data fingerprint from 'fingerprint'
+    :return: String hex digest
+    """
+    inputs = {name: value for name, value in parameters.items() if value is not None}
+    inputs.update(version=VERSION, fingerprint=digest)
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ResultStore:
+    """
+    This class reads and writes the runs of the results database. Every run
+    keeps its parameters as JSON, its data fingerprint, its 'sweep.RESULTS'
+    metrics and its trade ledger. Connections are opened per call, so one
+    store can be used from the GUI worker thread and from worker processes
+    """
+
+    def __init__(self, path=PATH):
+        """
+        Constructs a store, the database is created on first use
+
+        :param path: Path of the results database file
+        """
+        self.path = path
+        self.created = False
+
+    @contextlib.contextmanager
+    def connect(self):
+        """
+        Opens a connection to the results database
+        :return: Context manager giving a SQLite connection
+        """
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            if not self.created:
+                self.createTables(connection)
+            yield connection
+        finally:
+            connection.close()
+
+    def createTables(self, connection):
+        """
+        Creates the runs and trades tables. The database uses write-ahead
+        logging so worker processes can record runs while others read
+        :param connection: SQLite connection
+        :return:
+        """
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('CREATE TABLE IF NOT EXISTS runs(key TEXT PRIMARY KEY, created REAL, ticker TEXT, '
+                           'start_date INTEGER, end_date INTEGER, timeframe TEXT, capital REAL, parameters TEXT, '
+                           'fingerprint TEXT, ' + ', '.join(name + (' INTEGER' if name in COUNTS else ' REAL')
+                                                             for name in sweep.RESULTS) + ')')
+        connection.execute('CREATE INDEX IF NOT EXISTS runs_Ticker ON runs(ticker, created)')
+        connection.execute('CREATE TABLE IF NOT EXISTS trades(key TEXT, entry INTEGER, exit INTEGER, '
+                           'entry_price REAL, exit_price REAL, shares REAL, profit REAL, reason INTEGER)')
+        connection.execute('CREATE INDEX IF NOT EXISTS trades_Key ON trades(key)')
+        connection.commit()
+        self.created = True
+
+    def lookup(self, key):
+        """
+        Finds a stored run
+        :param key: String run key from 'runKey'
+        :return: Dictionary of the 'RUN' columns and 'sweep.RESULTS' metrics, or None
+        """
+        with self.connect() as connection:
+            row = connection.execute('SELECT ' + ', '.join(RUN + sweep.RESULTS) + ' FROM runs WHERE key=?',
+                                     (key,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(RUN + sweep.RESULTS, row))
+
+    def trades(self, key):
+        """
+        Reads the trade ledger of a stored run
+        :param key: String run key
+        :return: 'ledger.TRADE' structured array
+        """
+        with self.connect() as connection:
+            rows = connection.execute('SELECT entry, exit, entry_price, exit_price, shares, profit, reason '
+                                      'FROM trades WHERE key=? ORDER BY rowid', (key,)).fetchall()
+        return numpy.array(rows, dtype=ledger.TRADE)
+
+    def record(self, key, parameters, digest, result, trades):
+        """
+        Stores a run, replacing an earlier run with the same key
+        :param key: String run key from 'runKey'
+        :param parameters: Dictionary of the run inputs given to 'runKey'
+        :param digest: String data fingerprint
+        :param result: Dictionary with the 'sweep.RESULTS' metrics
+        :param trades: 'ledger.TRADE' structured array of the trades
+        :return:
+        """
+        row = (key, time.time(), parameters['ticker'], parameters['start'], parameters['end'],
+               parameters.get('timeframe'), parameters['capital'],
+               json.dumps(parameters, sort_keys=True, default=str), digest)
+        row += tuple(int(result[name]) if name in COUNTS else float(result[name]) for name in sweep.RESULTS)
+        with self.connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO runs VALUES (' + ', '.join('?' * len(row)) + ')', row)
+            connection.execute('DELETE FROM trades WHERE key=?', (key,))
+            connection.executemany('INSERT INTO trades VALUES (?,?,?,?,?,?,?,?)',
+                                   [(key,) + tuple(trade) for trade in trades.tolist()])
+            connection.commit()
+
+    def restore(self, key, capital, profile=None):
+        """
+        Rebuilds the result of a stored run as a backtest object with its
+        counters and ledger set and an empty DataFrame
+        :param key: String run key
+        :param capital: Integer Amount of capital used in back testing the thesis
+        :param profile: Optional 'profiling.py' Profiler of the run
+        :return: 'backtest.py' object, or None when the run is not stored
+        """
+        run = self.lookup(key)
+        if run is None:
+            return None
+        parameters = json.loads(run['parameters'])
+        test = backtest.Backtest([], query.COLUMNS, capital, parameters['stop_loss'], parameters['percentage'],
+                                 100, parameters['confirmation'], profile=profile,
+                                 timeframe=parameters.get('timeframe'))
+        test.ledger = ledger.TradeLedger.fromTrades(self.trades(key))
+        test.total_profit = run['total_profit']
+        test.costs = run['costs']
+        for name in COUNTS:
+            setattr(test, name, run[name])
+        return test
+
+    def history(self, ticker=None, limit=None):
+        """
+        Lists stored runs, newest first, with one column per parameter
+        so runs can be compared
+        :param ticker: Optional ticker symbol to list the runs of
+        :param limit: Optional largest number of runs
+        :return: Pandas DataFrame of the runs
+        """
+        sql = 'SELECT ' + ', '.join(RUN + sweep.RESULTS) + ' FROM runs'
+        values = ()
+        if ticker is not None:
+            sql += ' WHERE ticker=?'
+            values = (ticker,)
+        sql += ' ORDER BY created DESC'
+        if limit is not None:
+            sql += ' LIMIT ' + str(int(limit))
+        with self.connect() as connection:
+            runs = pandas.DataFrame(connection.execute(sql, values).fetchall(), columns=RUN + sweep.RESULTS)
+        settings = pandas.DataFrame([json.loads(parameters) for parameters in runs['parameters']], index=runs.index)
+        settings = settings.drop(columns=[column for column in settings if column in runs or column in
+                                          ('ticker', 'start', 'end', 'capital')])
+        runs['created'] = pandas.to_datetime(runs['created'], unit='s')
+        return pandas.concat([runs.drop(columns=['parameters']), settings], axis=1)
+
+    def find(self, prefix):
+        """
+        Finds the key of a stored run from its first characters
+        :param prefix: String start of a run key
+        :return: String run key
+        """
+        with self.connect() as connection:
+            keys = [row[0] for row in connection.execute('SELECT key FROM runs WHERE key LIKE ?', (prefix + '%',))]
+        if len(keys) != 1:
+            raise KeyError(str(len(keys)) + " runs start with " + prefix)
+        return keys[0]
+
+
+# Store shared by the backtests of one process
+STORE = ResultStore()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="List and compare stored backtest runs")
+    parser.add_argument('keys', nargs='*', help="Run keys, or their first characters, to compare")
+    parser.add_argument('--ticker', default=None, help="Only list the runs of a ticker")
+    parser.add_argument('--limit', type=int, default=20, help="Largest number of runs listed")
+    parser.add_argument('--trades', default=None, metavar='KEY', help="Print the trade ledger of a run")
+    parser.add_argument('--db', default=PATH, help="Results database file")
+    arguments = parser.parse_args()
+
+    store = ResultStore(arguments.db)
+    if arguments.trades is not None:
+        print(ledger.TradeLedger.fromTrades(store.trades(store.find(arguments.trades))).toFrame().to_string())
+    else:
+        table = store.history(arguments.ticker, None if arguments.keys else arguments.limit)
+        if arguments.keys:
+            table = table[table['key'].isin([store.find(prefix) for prefix in arguments.keys])]
+            # Show the runs side by side
+            table = table.set_index(table['key'].str[:12]).drop(columns=['key']).T
+        else:
+            table['key'] = table['key'].str[:12]
+        print(table.to_string())
@@ -0,0 +1,283 @@
+# Robustness File
+
+# This python file tests whether a backtest result is robust.
+# The closed trades are resampled with a block bootstrap, the
+# bar returns are resampled into new price paths and the risk
+# and indicator parameters are perturbed, and the spread of the
+# simulated results is reported as confidence intervals
+# on profit, win rate and drawdown
+
+# Imports
+import argparse
+import itertools
+import multiprocessing
+import multiprocessing.shared_memory as shared_memory
+import concurrent.futures
+import numpy as numpy
+import pandas as pandas
+import query as query
+import datasource as datasource
+import sweep as sweep
+import backtest as backtest
+import fills as fills
+
+# Results summarized with confidence intervals
+METRICS = ['total_profit', 'win_rate', 'drawdown']
+
+# Relative change of 'stop_loss' and 'percentage' in a perturbation
+SCALE = 0.2
+
+# Largest change of an indicator period in a perturbation, relative to the period
+PERIOD_SCALE = 0.2
+
+# Simulated trade sequences evaluated together by 'bootstrapTrades'
+BATCH = 1000
+
+# Columns of the bar data placed in shared memory
+SHARED = list(query.DTYPES)
+
+# Shared memory blocks and bar data of a worker process
+_BLOCKS = []
+_DATA = None
+
+
+def blockIndices(random, length, count, block):
+    """
+    Draws circular block bootstrap indices
+    :param random: NumPy random Generator
+    :param length: Number of items to resample
+    :param count: Number of resamples
+    :param block: Number of consecutive items in a block
+    :return: 2D NumPy int array of shape (count, length)
+    """
+    block = max(1, min(block, length))
+    blocks = -(-length // block)
+    starts = random.integers(0, length, size=(count, blocks, 1))
+    indices = (starts + numpy.arange(block)) % length
+    return indices.reshape(count, blocks * block)[:, :length]
+
+
+def bootstrapTrades(profits, capital, simulations=1000, block=5, seed=None):
+    """
+    Resamples the closed trades of a ledger with a circular block bootstrap,
+    keeping runs of consecutive trades together. Every simulation is a new
+    sequence of the same number of trades, evaluated in vectorized batches
+    :param profits: NumPy array of the profit of every trade
+    :param capital: Starting capital of the backtest
+    :param simulations: Number of resampled trade sequences
+    :param block: Number of consecutive trades in a block
+    :param seed: Optional random seed for repeatable results
+    :return: Pandas DataFrame with the 'METRICS' of every simulation
+    """
+    profits = numpy.asarray(profits, dtype=float)
+    random = numpy.random.default_rng(seed)
+    tables = []
+    for first in range(0, simulations, BATCH):
+        count = min(BATCH, simulations - first)
+        if not len(profits):
+            tables.append(numpy.zeros((count, 3)))
+            continue
+        sample = profits[blockIndices(random, len(profits), count, block)]
+        equity = capital + numpy.cumsum(sample, axis=1)
+        peak = numpy.maximum(numpy.maximum.accumulate(equity, axis=1), capital)
+        tables.append(numpy.column_stack((sample.sum(axis=1), (sample > 0).mean(axis=1),
+                                          ((peak - equity) / peak).max(axis=1))))
+    return pandas.DataFrame(numpy.concatenate(tables), columns=METRICS)
+
+
+def resamplePrices(data, random, block):
+    """
+    Builds a new price path from the bar returns with a circular block
+    bootstrap. The other price columns and the volume of every bar follow
+    the bar its return was drawn from
+    :param data: Dictionary of column arrays
+    :param random: NumPy random Generator
+    :param block: Number of consecutive bars in a block
+    :return: Dictionary of column arrays with the resampled prices
+    """
+    price = data['VolumeWeightPrice']
+    returns = numpy.diff(numpy.log(price))
+    source = blockIndices(random, len(returns), 1, block)[0] + 1
+    path = numpy.empty(len(price))
+    path[0] = price[0]
+    path[1:] = price[0] * numpy.exp(numpy.cumsum(returns[source - 1]))
+
+    source = numpy.r_[0, source]
+    resampled = dict(data)
+    for column in ['FirstTradePrice', 'HighTradePrice', 'LowTradePrice', 'LastTradePrice']:
+        resampled[column] = data[column][source] / price[source] * path
+    resampled['VolumeWeightPrice'] = path
+    resampled['Volume'] = data['Volume'][source]
+    resampled['TotalTrades'] = data['TotalTrades'][source]
+    return resampled
+
+
+def perturb(config, random, scale=SCALE, period_scale=PERIOD_SCALE):
+    """
+    Draws a configuration near another one. 'stop_loss' and 'percentage'
+    are scaled by up to 'scale' and every indicator period is moved by up
+    to 'period_scale' of its value, keeping the fast periods below the slow ones
+    :param config: Configuration dictionary (see 'sweep.DEFAULTS')
+    :param random: NumPy random Generator
+    :param scale: Largest relative change of 'stop_loss' and 'percentage'
+    :param period_scale: Largest relative change of the indicator periods
+    :return: Configuration dictionary
+    """
+    changed = dict(config)
+    for name in ['stop_loss', 'percentage']:
+        changed[name] = float(config[name] * random.uniform(1 - scale, 1 + scale))
+    for name in ['sma_fast', 'sma_slow', 'ema', 'macd_fast', 'macd_slow', 'rsi_period']:
+        spread = max(1, int(round(config[name] * period_scale)))
+        changed[name] = max(2, int(config[name] + random.integers(-spread, spread + 1)))
+    changed['sma_slow'] = max(changed['sma_slow'], changed['sma_fast'] + 1)
+    changed['macd_slow'] = max(changed['macd_slow'], changed['macd_fast'] + 1)
+    return changed
+
+
+def share(data):
+    """
+    Copies the bar data into shared memory blocks that
+    worker processes attach to without pickling it
+    :param data: Dictionary of column arrays
+    :return: Tuple of the list of SharedMemory blocks and the layout
+    dictionary of column names and (block name, dtype, length) tuples
+    """
+    blocks = []
+    layout = {}
+    for column in SHARED:
+        values = numpy.ascontiguousarray(data[column])
+        block = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+        numpy.ndarray(values.shape, values.dtype, buffer=block.buf)[:] = values
+        blocks.append(block)
+        layout[column] = (block.name, values.dtype.str, len(values))
+    return blocks, layout
+
+
+def _attach(layout, ticker):
+    """
+    Worker initializer that maps the shared bar data
+    :param layout: Layout dictionary from 'share'
+    :param ticker: String ticker symbol of the data
+    :return:
+    """
+    global _DATA
+    _DATA = {}
+    for column, (name, dtype, length) in layout.items():
+        block = shared_memory.SharedMemory(name=name)
+        _BLOCKS.append(block)
+        values = numpy.ndarray(length, numpy.dtype(dtype), buffer=block.buf)
+        values.setflags(write=False)
+        _DATA[column] = values
+    _DATA['Ticker'] = numpy.full(len(_DATA['Date']), ticker, dtype=object)
+
+
+def _simulate(capital, key, block, kind, seed, config):
+    """
+    Runs one simulation on the shared bar data in a worker process
+    :param capital: Integer Amount of capital used in back testing the thesis
+    :param key: (ticker, start, end) tuple of the data for the indicator cache
+    :param block: Number of consecutive bars in a bootstrap block
+    :param kind: 'prices' to backtest a resampled price path or
+    'parameters' to backtest a perturbed configuration
+    :param seed: Integer random seed of the simulation
+    :param config: Configuration dictionary
+    :return: Dictionary of 'sweep.RESULTS' values
+    """
+    if kind == 'prices':
+        data = resamplePrices(_DATA, numpy.random.default_rng(seed), block)
+        return sweep.runConfig(data, capital, config)
+    return sweep.runConfig(_DATA, capital, config, key)
+
+
+def simulate(data, capital, config, simulations=1000, kind='prices', block=60, seed=None, workers=None, key=None):
+    """
+    Runs many backtest simulations on a process pool. The bar data is placed
+    in shared memory once and every worker maps it, so a task only sends its
+    seed and configuration
+    :param data: Dictionary of column arrays (e.g. from 'query.readArrays')
+    :param capital: Integer Amount of capital used in back testing the thesis
+    :param config: Configuration dictionary (see 'sweep.DEFAULTS')
+    :param simulations: Number of simulations
+    :param kind: 'prices' for block bootstrapped price paths or 'parameters'
+    for perturbed 'stop_loss', 'percentage' and indicator periods
+    :param block: Number of consecutive bars in a bootstrap block
+    :param seed: Optional random seed for repeatable results
+    :param workers: Number of worker processes (defaults to the CPU count)
+    :param key: Optional (ticker, start, end) tuple of the data
+    :return: Pandas DataFrame of the configuration and results of every simulation
+    """
+    if kind not in ('prices', 'parameters'):
+        raise ValueError("Unknown simulation kind: " + kind)
+    random = numpy.random.default_rng(seed)
+    seeds = random.integers(0, 2 ** 63, size=simulations).tolist()
+    if kind == 'parameters':
+        configs = [perturb(config, random) for number in range(simulations)]
+    else:
+        configs = [config] * simulations
+
+    ticker = str(data['Ticker'][0]) if len(data['Ticker']) else ''
+    blocks, layout = share(data)
+    try:
+        with concurrent.futures.ProcessPoolExecutor(workers, initializer=_attach, initargs=(layout, ticker)) as pool:
+            chunksize = max(1, simulations // (4 * (workers or multiprocessing.cpu_count())))
+            results = list(pool.map(_simulate, itertools.repeat(capital), itertools.repeat(key),
+                                    itertools.repeat(block), itertools.repeat(kind), seeds, configs,
+                                    chunksize=chunksize))
+    finally:
+        for shared in blocks:
+            shared.close()
+            shared.unlink()
+    return pandas.DataFrame(results, columns=list(sweep.DEFAULTS) + sweep.RESULTS)
+
+
+def intervals(table, confidence=0.95):
+    """
+    Summarizes simulations with percentile confidence intervals
+    :param table: Pandas DataFrame with the 'METRICS' columns
+    :param confidence: Float confidence level (0.95)
+    :return: Pandas DataFrame of the lower bound, median and upper bound of every metric
+    """
+    tail = (1 - confidence) / 2 * 100
+    bounds = numpy.nanpercentile(table[METRICS].to_numpy(dtype=float), [tail, 50, 100 - tail], axis=0)
+    return pandas.DataFrame(bounds.T, index=METRICS, columns=['lower', 'median', 'upper'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Confidence intervals of the financial thesis for one ticker")
+    parser.add_argument('ticker', help="Ticker symbol (e.g. AAPL)")
+    parser.add_argument('start', type=int, help="Starting date (e.g. 20150514)")
+    parser.add_argument('end', type=int, help="Ending date (e.g. 20150527)")
+    parser.add_argument('settings', nargs='*', help="Parameter values, e.g. sma_fast=20 stop_loss=0.02")
+    parser.add_argument('--kind', default='trades', choices=['trades', 'prices', 'parameters'],
+                        help="Resample the trades, the bar returns or the parameters")
+    parser.add_argument('--simulations', type=int, default=1000, help="Number of simulations")
+    parser.add_argument('--block', type=int, default=None,
+                        help="Block length in trades or bars (defaults to 5 trades or 60 bars)")
+    parser.add_argument('--confidence', type=float, default=0.95, help="Confidence level")
+    parser.add_argument('--capital', type=int, default=1000000, help="Amount of capital for trades")
+    parser.add_argument('--seed', type=int, default=None, help="Random seed")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes")
+    arguments = parser.parse_args()
+
+    config = dict(sweep.DEFAULTS)
+    config.update((name, values[0]) for name, values in sweep.parseSpace(arguments.settings).items())
+    with datasource.pool(immutable=True).acquire() as connection:
+        data = query.readArrays(arguments.ticker, arguments.start, arguments.end, connection.cursor())
+
+    if arguments.kind == 'trades':
+        test = backtest.Backtest(data, query.COLUMNS, arguments.capital, config['stop_loss'],
+                                 config['percentage'], 100, config['confirmation'])
+        test.fillTable(config['sma_fast'], config['sma_slow'], config['ema'],
+                       config['macd_fast'], config['macd_slow'], config['rsi_period'])
+        test.vectorIterate()
+        model = fills.fromConfig(config)
+        if model is not None:
+            test.applyFills(model)
+        print("Backtest Profit: " + str(test.total_profit) + " Total Trades: " + str(len(test.ledger)))
+        table = bootstrapTrades(test.ledger.trades['profit'], arguments.capital, arguments.simulations,
+                                arguments.block or 5, arguments.seed)
+    else:
+        table = simulate(data, arguments.capital, config, arguments.simulations, arguments.kind,
+                         arguments.block or 60, arguments.seed, arguments.workers,
+                         (arguments.ticker, arguments.start, arguments.end))
+    print(intervals(table, arguments.confidence).to_string())
@@ -0,0 +1,325 @@
+# Rules File
+
+# This python file describes entrance and exit signals as
+# composable rule objects, or as rule text such as
+# 'cross(SMA_FAST, SMA_SLOW) & MACD > 0 & RSI >= 55',
+# so new signals can be tested without editing 'signals.py'.
+# A rule is evaluated once for every bar of a DataFrame
+# at a time and gives a NumPy boolean mask
+# FUNCTIONS ARE UTILIZED IN 'backtest.py'
+
+# Imports
+import ast
+import operator
+import numpy as numpy
+
+# Rules of the financial thesis, matching 'signals.entranceMask' and 'signals.exitMask'
+ENTRANCE = 'cross(SMA_FAST, SMA_SLOW) & MACD > 0 & RSI >= 55'
+EXIT = 'MACD < 0 | RSI < 55'
+
+# Comparison operators allowed in rule text
+COMPARISONS = {ast.Gt: operator.gt, ast.GtE: operator.ge, ast.Lt: operator.lt,
+               ast.LtE: operator.le, ast.Eq: operator.eq, ast.NotEq: operator.ne}
+
+
+class Columns:
+    """
+    This class gives the columns of a DataFrame as float NumPy arrays for
+    the rules. Each column is converted once, aliases (e.g. 'SMA_FAST') name
+    the indicator columns of a backtest, and 'rows' limits the bars
+    """
+
+    def __init__(self, df, aliases=None, rows=slice(None)):
+        """
+        :param df: Pandas DataFrame or dictionary of column arrays
+        :param aliases: Optional dictionary of alias and column names
+        :param rows: Slice of the rows to evaluate
+        """
+        self.df = df
+        self.aliases = aliases or {}
+        self.rows = rows
+        self.arrays = {}
+
+    def __getitem__(self, name):
+        column = self.aliases.get(name, name)
+        if column not in self.arrays:
+            if column not in self.df:
+                raise KeyError("Unknown rule column: " + name)
+            self.arrays[column] = numpy.asarray(self.df[column], dtype=float)[self.rows]
+        return self.arrays[column]
+
+
+class Rule:
+    """
+    This class is the base of every rule. Rules combine with '&', '|' and '~'
+    """
+
+    def mask(self, columns):
+        """
+        Evaluates the rule on every bar
+        :param columns: 'Columns' object or dictionary of column arrays
+        :return: NumPy boolean array, 0-d when the rule reads no column
+        """
+        raise NotImplementedError
+
+    def __and__(self, other):
+        return All(self, other)
+
+    def __or__(self, other):
+        return Any(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+
+class Value:
+    """
+    This class is an operand of a comparison, a column or a constant.
+    Comparing values gives a 'Compare' rule (e.g. Column('RSI') >= 55)
+    """
+
+    def values(self, columns):
+        """
+        :param columns: 'Columns' object or dictionary of column arrays
+        :return: NumPy float array or float
+        """
+        raise NotImplementedError
+
+    def compare(self, other, function):
+        return Compare(self, function, other if isinstance(other, Value) else Constant(other))
+
+    def __gt__(self, other):
+        return self.compare(other, operator.gt)
+
+    def __ge__(self, other):
+        return self.compare(other, operator.ge)
+
+    def __lt__(self, other):
+        return self.compare(other, operator.lt)
+
+    def __le__(self, other):
+        return self.compare(other, operator.le)
+
+
+class Column(Value):
+    """
+    This class is a DataFrame column, or an alias of one, used in a rule
+    """
+
+    def __init__(self, name):
+        """
+        :param name: Column label (e.g. 'RSI') or alias (e.g. 'SMA_FAST')
+        """
+        self.name = name
+
+    def values(self, columns):
+        return columns[self.name]
+
+    def __repr__(self):
+        return self.name
+
+
+class Constant(Value):
+    """
+    This class is a fixed threshold used in a rule
+    """
+
+    def __init__(self, value):
+        """
+        :param value: Float threshold
+        """
+        self.value = float(value)
+
+    def values(self, columns):
+        return self.value
+
+    def __repr__(self):
+        return repr(self.value)
+
+
+class Compare(Rule):
+    """
+    This class compares two values on every bar. Bars where
+    either value is NaN do not meet the comparison
+    """
+
+    def __init__(self, left, function, right):
+        """
+        :param left: 'Value' object
+        :param function: Comparison function from the 'operator' module
+        :param right: 'Value' object
+        """
+        self.left = left
+        self.function = function
+        self.right = right
+
+    def mask(self, columns):
+        return numpy.asarray(self.function(self.left.values(columns), self.right.values(columns)))
+
+
+class Cross(Rule):
+    """
+    This class is the golden crossover rule: the fast value is at or above
+    the slow value. With 'event' set only the bar on which the fast value
+    moves above the slow value meets the rule
+    """
+
+    def __init__(self, fast, slow, event=False):
+        """
+        :param fast: 'Value' object of the fast average
+        :param slow: 'Value' object of the slow average
+        :param event: Boolean value for whether or not only the crossing bar meets the rule
+        """
+        self.fast = fast
+        self.slow = slow
+        self.event = event
+
+    def mask(self, columns):
+        above = numpy.asarray(self.fast.values(columns) >= self.slow.values(columns))
+        if not self.event:
+            return above
+        if above.ndim == 0:
+            # Constant values never cross
+            return numpy.asarray(False)
+        crossed = above.copy()
+        crossed[1:] &= ~above[:-1]
+        return crossed
+
+
+class All(Rule):
+    """
+    This class is met where every one of its rules is met
+    """
+
+    def __init__(self, *rules):
+        """
+        :param rules: 'Rule' objects
+        """
+        self.rules = rules
+
+    def mask(self, columns):
+        result = self.rules[0].mask(columns)
+        for rule in self.rules[1:]:
+            result = result & rule.mask(columns)
+        return result
+
+
+class Any(Rule):
+    """
+    This class is met where at least one of its rules is met
+    """
+
+    def __init__(self, *rules):
+        """
+        :param rules: 'Rule' objects
+        """
+        self.rules = rules
+
+    def mask(self, columns):
+        result = self.rules[0].mask(columns)
+        for rule in self.rules[1:]:
+            result = result | rule.mask(columns)
+        return result
+
+
+class Not(Rule):
+    """
+    This class is met where its rule is not met
+    """
+
+    def __init__(self, rule):
+        """
+        :param rule: 'Rule' object
+        """
+        self.rule = rule
+
+    def mask(self, columns):
+        return ~self.rule.mask(columns)
+
+
+def cross(fast, slow):
+    """
+    :param fast: 'Value' object or column name of the fast average
+    :param slow: 'Value' object or column name of the slow average
+    :return: 'Cross' rule met while the fast value is at or above the slow value
+    """
+    return Cross(Column(fast) if isinstance(fast, str) else fast, Column(slow) if isinstance(slow, str) else slow)
+
+
+def crossover(fast, slow):
+    """
+    :param fast: 'Value' object or column name of the fast average
+    :param slow: 'Value' object or column name of the slow average
+    :return: 'Cross' rule met on the bar where the fast value moves above the slow value
+    """
+    return Cross(Column(fast) if isinstance(fast, str) else fast, Column(slow) if isinstance(slow, str) else slow, True)
+
+
+# Functions allowed in rule text
+FUNCTIONS = {'cross': cross, 'crossover': crossover}
+
+
+def parse(text, **parameters):
+    """
+    Parses rule text into a rule. Rules combine comparisons of columns and
+    numbers with '&' (or 'and'), '|' (or 'or') and '~' (or 'not') and call
+    'cross' or 'crossover'. '&' and '|' are read with the precedence of 'and'
+    and 'or', so 'MACD > 0 & RSI >= 55' needs no brackets. Other names are
+    columns unless they are given as parameters, so thresholds can be set per
+    run (e.g. parse('RSI >= level', level=55))
+    :param text: String rule
+    :param parameters: Numbers for names used in the rule text
+    :return: 'Rule' object
+    """
+    source = text.replace('&', ' and ').replace('|', ' or ').replace('~', ' not ')
+    try:
+        tree = ast.parse(source.strip(), mode='eval').body
+    except SyntaxError as error:
+        raise ValueError("Invalid rule '" + text + "': " + str(error.msg))
+
+    def value(node):
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return Constant(node.value)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            operand = value(node.operand)
+            if isinstance(operand, Constant):
+                return Constant(-operand.value)
+        if isinstance(node, ast.Name):
+            if node.id in parameters:
+                return Constant(parameters[node.id])
+            return Column(node.id)
+        raise ValueError("Invalid value in rule '" + text + "': " + ast.dump(node))
+
+    def rule(node):
+        if isinstance(node, ast.BoolOp):
+            rules = [rule(operand) for operand in node.values]
+            return All(*rules) if isinstance(node.op, ast.And) else Any(*rules)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return Not(rule(node.operand))
+        if isinstance(node, ast.Compare):
+            # Chained comparisons such as '30 < RSI < 70'
+            operands = [value(node.left)] + [value(operand) for operand in node.comparators]
+            comparisons = []
+            for left, kind, right in zip(operands, node.ops, operands[1:]):
+                if type(kind) not in COMPARISONS:
+                    raise ValueError("Invalid comparison in rule '" + text + "'")
+                comparisons.append(Compare(left, COMPARISONS[type(kind)], right))
+            return comparisons[0] if len(comparisons) == 1 else All(*comparisons)
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS
+                and len(node.args) == 2 and not node.keywords):
+            return FUNCTIONS[node.func.id](value(node.args[0]), value(node.args[1]))
+        raise ValueError("Invalid rule '" + text + "': " + ast.dump(node))
+
+    return rule(tree)
+
+
+def makeRule(rule, **parameters):
+    """
+    Turns rule text or a rule object into a rule object
+    :param rule: String rule or 'Rule' object
+    :param parameters: Numbers for names used in the rule text
+    :return: 'Rule' object
+    """
+    if isinstance(rule, Rule):
+        return rule
+    return parse(rule, **parameters)
@@ -0,0 +1,70 @@
+# Sessions File
+
+# This python file contains the functions to
+# parse bar start times and filter the trading
+# session used to test my financial thesis
+# FUNCTIONS ARE UTILIZED IN 'backtest.py' and 'query.py'
+
+# Imports
+import numpy as numpy
+import pandas as pandas
+
+# Regular session boundaries in HHMM form (both inclusive). Use
+# 931 as the start to exclude the opening auction bar
+MARKET_OPEN = 930
+MARKET_CLOSE = 1600
+
+
+def toMinutes(hhmm):
+    """
+    Converts an HHMM integer (e.g. 930) to minutes since midnight
+    :param hhmm: Integer time value
+    :return: Integer minutes since midnight
+    """
+    return (hhmm // 100) * 60 + hhmm % 100
+
+
+def toHHMM(minutes):
+    """
+    Converts minutes since midnight back to the HHMM integer form
+    :param minutes: Integer or NumPy array of minutes since midnight
+    :return: HHMM integer or NumPy array
+    """
+    return (minutes // 60) * 100 + minutes % 60
+
+
+def minutesOfDay(times):
+    """
+    Parses 'TimeBarStart' values ('09:30' strings or HHMM numbers) into
+    minutes since midnight. Each distinct time is parsed only once, so
+    the cost does not grow with the number of trading days
+    :param times: Pandas Series or array of bar start times
+    :return: NumPy int16 array of minutes since midnight
+    """
+    codes, uniques = pandas.factorize(pandas.Series(times), use_na_sentinel=False)
+    parsed = numpy.array([toMinutes(int(float(str(time).replace(":", "")))) for time in uniques],
+                         dtype=numpy.int16)
+    return parsed[codes]
+
+
+def sessionMask(times, start=MARKET_OPEN, end=MARKET_CLOSE):
+    """
+    Determines which bars fall inside the trading session
+    :param times: Pandas Series or array of bar start times
+    :param start: HHMM integer session start (inclusive)
+    :param end: HHMM integer session end (inclusive)
+    :return: NumPy boolean array, True for bars inside the session
+    """
+    minutes = minutesOfDay(times)
+    return (minutes >= toMinutes(start)) & (minutes <= toMinutes(end))
+
+
+def sessionClause(start=MARKET_OPEN, end=MARKET_CLOSE):
+    """
+    Builds the SQL condition that applies the same session filter inside
+    the 'trading.db' query so out of session rows never reach Pandas
+    :param start: HHMM integer session start (inclusive)
+    :param end: HHMM integer session end (inclusive)
+    :return: Tuple of the SQL condition and its parameters
+    """
+    return "CAST(REPLACE(TimeBarStart, ':', '') AS INTEGER) BETWEEN ? AND ?", (start, end)
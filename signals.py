@@ -111,3 +111,30 @@ def positionExit(divergence, rsi):
     else:
         return False
 
+
+
+# VECTORIZED SIGNALS
+def entranceMask(slow, fast, divergence, rsi):
+    """
+    Array counterpart of positionEntrance. Evaluates the golden
+    crossover, MACD and RSI entrance signals for every bar at once
+    :param slow: NumPy array of slow simple moving average values
+    :param fast: NumPy array of fast simple moving average values
+    :param divergence: NumPy array of macd divergence values
+    :param rsi: NumPy array of rsi values
+    :return: NumPy boolean array, True where the
+    financial thesis entrance signal is met
+    """
+    return (slow <= fast) & (divergence > 0) & (rsi >= 55)
+
+
+def exitMask(divergence, rsi):
+    """
+    Array counterpart of positionExit. Evaluates the MACD and
+    RSI exit signals for every bar at once
+    :param divergence: NumPy array of macd divergence values
+    :param rsi: NumPy array of rsi values
+    :return: NumPy boolean array, True where the
+    financial thesis exit signal is met
+    """
+    return (divergence < 0) | (rsi < 55)
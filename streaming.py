@@ -0,0 +1,210 @@
+# Streaming Indicators File
+
+# This python file contains incremental versions of the
+# indicators in 'indicators.py'. Each object keeps a
+# small running state and is updated one bar at a time
+# in constant time, giving the same values as the batch
+# functions on the full DataFrame
+# CLASSES ARE UTILIZED IN 'replay.py'
+
+# Imports
+import math
+
+NAN = float('nan')
+
+
+class RollingMean:
+    """
+    This class is the rolling mean of the last 'period' values, matching
+    Pandas 'rolling(window=period).mean()'. The window is a ring buffer with
+    a running sum, and the sum is recomputed exactly each time the buffer
+    wraps around so rounding errors cannot build up over a session
+    """
+
+    def __init__(self, period):
+        """
+        :param period: Integer window length
+        """
+        self.period = period
+        self.window = [NAN] * period
+        self.position = 0
+        self.total = 0.0
+        self.missing = period
+
+    def update(self, value):
+        """
+        Adds a value to the window
+        :param value: Float value (NaN values leave the window incomplete)
+        :return: Float rolling mean, NaN until the window holds 'period' values
+        """
+        old = self.window[self.position]
+        if old == old:
+            self.total -= old
+        else:
+            self.missing -= 1
+        if value == value:
+            self.total += value
+        else:
+            self.missing += 1
+        self.window[self.position] = value
+
+        self.position += 1
+        if self.position == self.period:
+            self.position = 0
+            self.total = math.fsum(old for old in self.window if old == old)
+
+        if self.missing:
+            return NAN
+        return self.total / self.period
+
+
+class SimpleMA:
+    """
+    This class is the incremental version of 'indicators.simpleMA'
+    """
+
+    def __init__(self, period):
+        """
+        :param period: Integer value used for
+        simple moving average calculation
+        """
+        self.mean = RollingMean(period)
+        self.value = NAN
+
+    def update(self, price):
+        """
+        Updates the simple moving average with the price of a new bar
+        :param price: Float price of the bar
+        :return: Float simple moving average
+        """
+        self.value = self.mean.update(price)
+        return self.value
+
+
+class ExponentialMA:
+    """
+    This class is the incremental version of 'indicators.exponentialMA',
+    matching Pandas 'ewm(span=period, min_periods=period).mean()'. The
+    adjusted weighting is kept as two O(1) recurrences of the weighted
+    sum of prices and of the sum of weights
+    """
+
+    def __init__(self, period):
+        """
+        :param period: Integer value used for
+        exponential moving average calculation
+        """
+        self.period = period
+        self.decay = 1.0 - 2.0 / (period + 1.0)
+        self.numerator = 0.0
+        self.denominator = 0.0
+        self.count = 0
+        self.value = NAN
+
+    def update(self, price):
+        """
+        Updates the exponential moving average with the price of a new bar
+        :param price: Float price of the bar
+        :return: Float exponential moving average, NaN for the first 'period' - 1 bars
+        """
+        self.numerator *= self.decay
+        self.denominator *= self.decay
+        if price == price:
+            self.numerator += price
+            self.denominator += 1.0
+            self.count += 1
+        if self.count >= self.period:
+            self.value = self.numerator / self.denominator
+        return self.value
+
+
+class MovingAverageConvergence:
+    """
+    This class is the incremental version of 'indicators.movingAverageConvergence'
+    """
+
+    def __init__(self, fast, slow):
+        """
+        :param fast: Integer value used for
+        fast exponential moving average calculation
+        :param slow: Integer value used for
+        slow exponential moving average calculation
+        """
+        self.fast = ExponentialMA(fast)
+        self.slow = ExponentialMA(slow)
+        self.value = NAN
+
+    def update(self, price):
+        """
+        Updates the MACD value with the price of a new bar
+        :param price: Float price of the bar
+        :return: Float MACD value
+        """
+        self.value = self.fast.update(price) - self.slow.update(price)
+        return self.value
+
+
+class RelativeStrength:
+    """
+    This class is the incremental version of 'indicators.rsi'. Gains and
+    losses of the price changes are kept as two running rolling means
+    """
+
+    def __init__(self, period):
+        """
+        :param period: integer value used for rsi calculation
+        """
+        self.gain = RollingMean(period)
+        self.loss = RollingMean(period)
+        self.previous = NAN
+        self.value = NAN
+
+    def update(self, price):
+        """
+        Updates the relative strength index with the price of a new bar
+        :param price: Float price of the bar
+        :return: Float RSI value
+        """
+        delta = price - self.previous
+        self.previous = price
+        average_gain = self.gain.update(max(delta, 0.0) if delta == delta else NAN)
+        average_loss = abs(self.loss.update(min(delta, 0.0) if delta == delta else NAN))
+
+        # Same results as the Pandas division, including the zero loss cases
+        if average_gain != average_gain or average_loss != average_loss:
+            self.value = NAN
+        elif average_loss == 0.0:
+            self.value = 100.0 if average_gain > 0.0 else NAN
+        else:
+            self.value = 100 - (100/(1 + average_gain/average_loss))
+        return self.value
+
+
+class IndicatorSet:
+    """
+    This class updates every indicator used by 'Backtest.fillTable' for
+    one ticker and names the values like the DataFrame columns
+    """
+
+    def __init__(self, sma_fast, sma_slow, ema, macd_fast, macd_slow, rsi_period):
+        """
+        :param sma_fast: Fast simple moving average value (50)
+        :param sma_slow: Slow simple moving average value (200)
+        :param ema: Exponential moving average value (9)
+        :param macd_fast: Fast moving average convergence divergence value (13)
+        :param macd_slow: Slow moving average convergence divergence value (26)
+        :param rsi_period: Relative strength index value (14)
+        """
+        self.indicators = {"SMA" + str(sma_fast): SimpleMA(sma_fast),
+                           "SMA" + str(sma_slow): SimpleMA(sma_slow),
+                           "EMA" + str(ema): ExponentialMA(ema),
+                           'MACD': MovingAverageConvergence(macd_fast, macd_slow),
+                           'RSI': RelativeStrength(rsi_period)}
+
+    def update(self, price):
+        """
+        Updates every indicator with the price of a new bar
+        :param price: Float price of the bar
+        :return: Dictionary of column labels and indicator values
+        """
+        return {column: indicator.update(price) for column, indicator in self.indicators.items()}
@@ -0,0 +1,234 @@
+# Parameter Sweep File
+
+# This python file runs the financial thesis over many
+# indicator and risk configurations in parallel to find
+# better values than the defaults hardcoded in 'gui.py'
+
+# Imports
+import argparse
+import itertools
+import multiprocessing
+import random
+import concurrent.futures
+import pandas as pandas
+import backtest as backtest
+import query as query
+import datasource as datasource
+import cache as cache
+import fills as fills
+
+# Default configuration, matching the values used by 'gui.py'
+DEFAULTS = {'sma_fast': 50, 'sma_slow': 200, 'ema': 9, 'macd_fast': 13, 'macd_slow': 26,
+            'rsi_period': 14, 'stop_loss': 0.05, 'percentage': 0.2, 'confirmation': 70}
+
+# Optional configuration entries with 'rules.py' rule text for the entrance and exit signals
+RULES = ['entry_rule', 'exit_rule']
+
+# Result columns reported for every configuration
+RESULTS = ['total_profit', 'won', 'lost', 'trades', 'costs', 'win_rate', 'drawdown', 'sharpe', 'exposure']
+
+# Bar data shared read-only with the worker processes
+_DATA = None
+
+
+def grid(space):
+    """
+    Expands a parameter space into every combination of its values
+    :param space: Dictionary of parameter names and lists of values,
+    parameters that are left out keep their 'DEFAULTS' value
+    :return: List of configuration dictionaries
+    """
+    names = list(space)
+    configs = []
+    for values in itertools.product(*(space[name] for name in names)):
+        config = dict(DEFAULTS)
+        config.update(zip(names, values))
+        configs.append(config)
+    return configs
+
+
+def randomSample(space, count, seed=None):
+    """
+    Draws random combinations from a parameter space without repeats
+    :param space: Dictionary of parameter names and lists of values
+    :param count: Number of configurations to draw
+    :param seed: Optional random seed for repeatable sweeps
+    :return: List of configuration dictionaries
+    """
+    configs = grid(space)
+    return random.Random(seed).sample(configs, min(count, len(configs)))
+
+
+def runTest(data, capital, config, key=None, timeframe=None, profile=None):
+    """
+    Backtests one configuration using the vectorized engine
+    :param data: Query result or dictionary of column arrays
+    :param capital: Integer Amount of capital used in back testing the thesis
+    :param config: Configuration dictionary (see 'DEFAULTS'), optionally with
+    'RULES' entries replacing the entrance and exit signals and 'fills.COSTS'
+    entries of the trading costs
+    :param key: Optional (ticker, start, end) tuple of the data, which lets
+    configurations with the same periods share cached indicator columns
+    :param timeframe: Optional 'timeframes.py' label of the bars in the data
+    :param profile: Optional 'profiling.py' Profiler that times the stages
+    :return: 'backtest.py' object after the backtest
+    """
+    test = backtest.Backtest(data, query.COLUMNS, capital, config['stop_loss'], config['percentage'],
+                             100, config['confirmation'], key, profile, timeframe=timeframe, lean=True)
+    test.fillTable(config['sma_fast'], config['sma_slow'], config['ema'],
+                   config['macd_fast'], config['macd_slow'], config['rsi_period'], cache.CACHE)
+    test.vectorIterate(entry_rule=config.get('entry_rule'), exit_rule=config.get('exit_rule'))
+    model = fills.fromConfig(config)
+    if model is not None:
+        test.applyFills(model)
+    return test
+
+
+def summarize(config, test):
+    """
+    :param config: Configuration dictionary of the backtest
+    :param test: 'backtest.py' object after the backtest
+    :return: Configuration dictionary updated with the 'RESULTS' values
+    """
+    result = dict(config)
+    result.update(test.statistics())
+    for name in ['total_profit', 'won', 'lost', 'trades', 'costs']:
+        result[name] = getattr(test, name)
+    return result
+
+
+def runConfig(data, capital, config, key=None, timeframe=None):
+    """
+    Backtests one configuration with 'runTest'
+    :param data: Query result or dictionary of column arrays
+    :param capital: Integer Amount of capital used in back testing the thesis
+    :param config: Configuration dictionary (see 'runTest')
+    :param key: Optional (ticker, start, end) tuple of the data
+    :param timeframe: Optional 'timeframes.py' label of the bars in the data
+    :return: Configuration dictionary updated with the 'RESULTS' values
+    """
+    return summarize(config, runTest(data, capital, config, key, timeframe))
+
+
+def _share(data):
+    """
+    Worker initializer that stores the shared bar data
+    :param data: Dictionary of column arrays
+    :return:
+    """
+    global _DATA
+    _DATA = data
+
+
+def sharedPool(data, workers=None):
+    """
+    Makes the bar data read-only and starts a process pool whose workers
+    read it with 'sharedData'. Where processes are forked the workers
+    inherit the data without copying, otherwise it is sent once per worker
+    :param data: Dictionary of column arrays (e.g. from 'query.readArrays')
+    :param workers: Number of worker processes (defaults to the CPU count)
+    :return: ProcessPoolExecutor
+    """
+    for values in data.values():
+        values.setflags(write=False)
+    if 'fork' in multiprocessing.get_all_start_methods():
+        _share(data)
+        return concurrent.futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+    return concurrent.futures.ProcessPoolExecutor(workers, initializer=_share, initargs=(data,))
+
+
+def sharedData():
+    """
+    :return: Dictionary of column arrays given to 'sharedPool', in a worker process
+    """
+    return _DATA
+
+
+def _work(capital, key, timeframe, config):
+    """
+    Runs one configuration on the shared bar data in a worker process
+    :param capital: Integer Amount of capital used in back testing the thesis
+    :param key: Optional (ticker, start, end) tuple of the data
+    :param timeframe: Optional 'timeframes.py' label of the bars in the data
+    :param config: Configuration dictionary
+    :return: Configuration dictionary updated with the 'RESULTS' values
+    """
+    return runConfig(_DATA, capital, config, key, timeframe)
+
+
+def sweep(data, capital, configs, workers=None, key=None, timeframe=None):
+    """
+    Backtests every configuration on a process pool. The bar data is loaded
+    once by the caller and shared with the workers by 'sharedPool'
+    :param data: Dictionary of column arrays (e.g. from 'query.readArrays')
+    :param capital: Integer Amount of capital used in back testing the thesis
+    :param configs: List of configuration dictionaries
+    :param workers: Number of worker processes (defaults to the CPU count)
+    :param key: Optional (ticker, start, end) tuple of the data, which turns
+    on the indicator cache of each worker
+    :param timeframe: Optional 'timeframes.py' label of the bars in the data
+    :return: Pandas DataFrame of configurations and results ranked by total profit
+    """
+    with sharedPool(data, workers) as pool:
+        chunksize = max(1, len(configs) // (4 * (workers or multiprocessing.cpu_count())))
+        results = list(pool.map(_work, itertools.repeat(capital), itertools.repeat(key),
+                                itertools.repeat(timeframe), configs,
+                                chunksize=chunksize))
+
+    rules = RULES if any(config.get(name) for config in configs for name in RULES) else []
+    costs = [name for name in fills.COSTS if any(name in config for config in configs)]
+    table = pandas.DataFrame(results, columns=list(DEFAULTS) + rules + costs + RESULTS)
+    return table.sort_values('total_profit', ascending=False, ignore_index=True)
+
+
+def parseSpace(settings):
+    """
+    Parses command line settings of the form 'name=value1,value2'
+    :param settings: List of setting strings
+    :return: Dictionary of parameter names and lists of values
+    """
+    space = {}
+    for setting in settings:
+        name, values = setting.split('=')
+        if name not in DEFAULTS and name not in fills.COSTS:
+            raise ValueError("Unknown parameter: " + name)
+        space[name] = [type(DEFAULTS.get(name, 0.0))(value) for value in values.split(',')]
+        if name == 'confirmation' and min(space[name]) < 0:
+            raise ValueError("Negative confirmation period: " + values)
+    return space
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sweep the financial thesis parameters for one ticker")
+    parser.add_argument('ticker', help="Ticker symbol (e.g. AAPL)")
+    parser.add_argument('start', type=int, help="Starting date (e.g. 20150514)")
+    parser.add_argument('end', type=int, help="Ending date (e.g. 20150527)")
+    parser.add_argument('settings', nargs='*', help="Parameter values, e.g. sma_fast=20,50 stop_loss=0.02,0.05")
+    parser.add_argument('--capital', type=int, default=1000000, help="Amount of capital for trades")
+    parser.add_argument('--random', type=int, default=None, help="Number of random configurations to draw")
+    parser.add_argument('--seed', type=int, default=None, help="Random seed")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes")
+    parser.add_argument('--top', type=int, default=20, help="Number of ranked results to print")
+    parser.add_argument('--output', default=None, help="CSV file for the full ranked results")
+    parser.add_argument('--timeframe', default=None, help="Rollup bar timeframe (e.g. 15m) instead of minute bars")
+    parser.add_argument('--entry', default=None, help="Entrance rule, e.g. 'cross(SMA_FAST, SMA_SLOW) & RSI >= 60'")
+    parser.add_argument('--exit', default=None, help="Exit rule, e.g. 'MACD < 0 | RSI < 50'")
+    arguments = parser.parse_args()
+
+    space = parseSpace(arguments.settings)
+    if arguments.random is None:
+        configs = grid(space)
+    else:
+        configs = randomSample(space, arguments.random, arguments.seed)
+    for config in configs:
+        config.update(entry_rule=arguments.entry, exit_rule=arguments.exit)
+
+    with datasource.pool(immutable=True).acquire() as connection:
+        data = query.readArrays(arguments.ticker, arguments.start, arguments.end, connection.cursor(),
+                                timeframe=arguments.timeframe)
+
+    table = sweep(data, arguments.capital, configs, arguments.workers,
+                  (arguments.ticker, arguments.start, arguments.end), arguments.timeframe)
+    print(table.head(arguments.top).to_string())
+    if arguments.output is not None:
+        table.to_csv(arguments.output, index=False)
@@ -0,0 +1,111 @@
+# Synthetic Database File
+
+# This python file writes a deterministic synthetic
+# database with the 'Algo_Trading' schema so the
+# backtest pipeline can be measured without the
+# real dataset, which is too large to share
+
+# Imports
+import argparse
+import datetime
+import sqlite3 as sqlite3
+import numpy as numpy
+import database as database
+import portfolio as portfolio
+
+# Minute bars of a synthetic trading day, 04:00 until 19:59 like the real data
+FIRST_MINUTE = 4 * 60
+LAST_MINUTE = 20 * 60 - 1
+
+
+def tradingDays(start, days):
+    """
+    Lists the weekdays starting at a date
+    :param start: Integer starting date (e.g. 20150102)
+    :param days: Number of trading days
+    :return: List of integer dates
+    """
+    day = datetime.datetime.strptime(str(start), '%Y%m%d').date()
+    dates = []
+    while len(dates) < days:
+        if day.weekday() < 5:
+            dates.append(int(day.strftime('%Y%m%d')))
+        day += datetime.timedelta(days=1)
+    return dates
+
+
+def tickerRows(ticker, dates, rng):
+    """
+    Simulates the minute bars of one ticker as a random walk
+    :param ticker: String ticker symbol
+    :param dates: List of integer dates
+    :param rng: NumPy random Generator
+    :return: List of row tuples in 'query.COLUMNS' order
+    """
+    minutes = numpy.arange(FIRST_MINUTE, LAST_MINUTE + 1)
+    per_day = len(minutes)
+    size = len(dates) * per_day
+
+    # Log price random walk with a little drift, quieter outside the session
+    quiet = (minutes < 9 * 60 + 30) | (minutes > 16 * 60)
+    volatility = numpy.tile(numpy.where(quiet, 0.0003, 0.001), len(dates))
+    last = rng.uniform(20.0, 500.0) * numpy.exp(numpy.cumsum(rng.normal(0.00001, 1.0, size) * volatility))
+    first = numpy.r_[last[0], last[:-1]]
+    spread = numpy.abs(rng.normal(0.0, 0.0005, size)) * last
+    high = numpy.maximum(first, last) + spread
+    low = numpy.minimum(first, last) - spread
+    vwap = low + (high - low) * rng.uniform(0.25, 0.75, size)
+    volume = rng.integers(100, 5000, size) * numpy.tile(numpy.where(quiet, 1, 10), len(dates))
+    trades = numpy.maximum(1, volume // rng.integers(50, 200, size))
+
+    times = ['%02d:%02d' % (minute // 60, minute % 60) for minute in minutes]
+    return list(zip(numpy.repeat(dates, per_day).tolist(), [ticker] * size, times * len(dates),
+                    first.round(4).tolist(), high.round(4).tolist(), low.round(4).tolist(),
+                    last.round(4).tolist(), vwap.round(4).tolist(), volume.tolist(), trades.tolist()))
+
+
+def generate(path, tickers, days, start=20150102, seed=0):
+    """
+    Writes a synthetic 'Algo_Trading' database. The same arguments always
+    produce the same rows, so timings can be compared between commits
+    :param path: Path of the SQLite database file, which must not hold any rows yet
+    :param tickers: Number of tickers (the first tickers of 'portfolio.TICKERS')
+    or a list of ticker symbols
+    :param days: Number of trading days of minute bars
+    :param start: Integer starting date
+    :param seed: Integer random seed
+    :return: Number of rows written
+    """
+    if isinstance(tickers, int):
+        tickers = portfolio.TICKERS[:tickers]
+    dates = tradingDays(start, days)
+    streams = numpy.random.SeedSequence(seed).spawn(len(tickers))
+
+    connection = sqlite3.connect(path)
+    database.create_table(connection.cursor())
+    if connection.execute('SELECT COUNT(*) FROM Algo_Trading').fetchone()[0]:
+        connection.close()
+        raise ValueError(path + " already holds 'Algo_Trading' rows")
+    connection.execute('DROP INDEX IF EXISTS ' + database.INDEX_NAME)
+    total = 0
+    for ticker, stream in zip(tickers, streams):
+        rows = tickerRows(ticker, dates, numpy.random.default_rng(stream))
+        connection.executemany('INSERT INTO Algo_Trading VALUES (?,?,?,?,?,?,?,?,?,?)', rows)
+        connection.commit()
+        total += len(rows)
+    database.migrate(connection)
+    connection.close()
+    return total
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write a synthetic 'Algo_Trading' database")
+    parser.add_argument('path', nargs='?', default='synthetic.db', help="SQLite database file")
+    parser.add_argument('--tickers', type=int, default=25, help="Number of tickers")
+    parser.add_argument('--days', type=int, default=20, help="Number of trading days")
+    parser.add_argument('--start', type=int, default=20150102, help="Starting date")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    arguments = parser.parse_args()
+
+    rows = generate(arguments.path, arguments.tickers, arguments.days, arguments.start, arguments.seed)
+    print("Wrote " + str(rows) + " rows to " + arguments.path)
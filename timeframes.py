@@ -0,0 +1,167 @@
+# Timeframes File
+
+# This python file rolls the one minute bars of 'Algo_Trading'
+# up into 5, 15 and 60 minute and daily bar tables once, so
+# backtests on a longer timeframe read the rolled up rows
+# instead of resampling the minute bars on every run
+# FUNCTIONS ARE UTILIZED IN 'database.py'
+
+# Imports
+import numpy as numpy
+import query as query
+import sessions as sessions
+
+# Timeframe labels and their bar lengths in minutes, a daily bar covers the session
+TIMEFRAMES = {'5m': 5, '15m': 15, '60m': 60, '1d': 24 * 60}
+
+
+def createTables(connection, names=TIMEFRAMES):
+    """
+    Creates the rollup tables with the 'Algo_Trading' columns and
+    the (Ticker, Date, TimeBarStart) index of 'database.py'
+    :param connection: SQLite connection
+    :param names: Timeframe labels of the tables
+    :return:
+    """
+    for name in names:
+        table = query.tableName(name)
+        connection.execute('CREATE TABLE IF NOT EXISTS ' + table + '(Date INTEGER, Ticker TEXT, TimeBarStart REAL, '
+                           'FirstTradePrice REAL, HighTradePrice REAL, LowTradePrice REAL, LastTradePrice REAL, '
+                           'VolumeWeightPrice REAL, Volume INTEGER, TotalTrades INTEGER)')
+        connection.execute('CREATE INDEX IF NOT EXISTS ' + table + '_Ticker_Date ON ' + table +
+                           '(Ticker, Date, TimeBarStart)')
+
+
+def existing(connection):
+    """
+    Finds the rollup tables that have been built
+    :param connection: SQLite connection
+    :return: List of timeframe labels
+    """
+    tables = set(row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type='table'"))
+    return [name for name in TIMEFRAMES if query.tableName(name) in tables]
+
+
+def aggregate(data, minutes):
+    """
+    Rolls sorted one minute bars up into bars of a timeframe. Bars are aligned
+    to the market open (e.g. 9:30, 10:30 for 60 minutes) and keep the first
+    and last trade price, the high, the low, the summed volume and trades and
+    the volume weighted price of their minutes
+    :param data: Dictionary of 'query.DTYPES' column arrays in (Date, TimeBarStart) order
+    :param minutes: Bar length in minutes
+    :return: Dictionary of column arrays of the rolled up bars
+    """
+    opening = sessions.toMinutes(sessions.MARKET_OPEN)
+    offset = sessions.toMinutes(data['TimeBarStart'].astype(numpy.int32)) - opening
+    bucket = opening + (offset // minutes) * minutes
+    if minutes >= TIMEFRAMES['1d']:
+        bucket = numpy.full(len(offset), opening)
+
+    dates = data['Date']
+    changes = (dates[1:] != dates[:-1]) | (bucket[1:] != bucket[:-1])
+    starts = numpy.flatnonzero(numpy.r_[True, changes])
+    ends = numpy.r_[starts[1:], len(dates)]
+
+    volume = data['Volume']
+    price = data['VolumeWeightPrice']
+    total = numpy.add.reduceat(volume, starts)
+    weighted = numpy.add.reduceat(price * volume, starts)
+    average = numpy.add.reduceat(price, starts) / (ends - starts)
+    return {'Date': dates[starts],
+            'TimeBarStart': sessions.toHHMM(bucket[starts]).astype(numpy.int16),
+            'FirstTradePrice': data['FirstTradePrice'][starts],
+            'HighTradePrice': numpy.maximum.reduceat(data['HighTradePrice'], starts),
+            'LowTradePrice': numpy.minimum.reduceat(data['LowTradePrice'], starts),
+            'LastTradePrice': data['LastTradePrice'][ends - 1],
+            'VolumeWeightPrice': numpy.divide(weighted, total, out=average, where=total > 0),
+            'Volume': total,
+            'TotalTrades': numpy.add.reduceat(data['TotalTrades'], starts)}
+
+
+def rows(ticker, bars):
+    """
+    Converts rolled up bars into 'Algo_Trading' row tuples,
+    writing 'TimeBarStart' as 'HH:MM' text like the minute bars
+    :param ticker: String ticker symbol (e.g. AAPL)
+    :param bars: Dictionary of column arrays from 'aggregate'
+    :return: List of row tuples in 'query.COLUMNS' order
+    """
+    times = ['%02d:%02d' % divmod(hhmm, 100) for hhmm in bars['TimeBarStart'].tolist()]
+    columns = [bars['Date'].tolist(), [ticker] * len(times), times]
+    columns += [bars[column].tolist() for column in query.COLUMNS[3:]]
+    return list(zip(*columns))
+
+
+# Regular session the rollup tables are built from
+SESSION = (sessions.MARKET_OPEN, sessions.MARKET_CLOSE)
+
+
+def days(cursor, ticker, timeframe=None, session=None):
+    """
+    Finds the days a bar table holds, reading only the index
+    :param cursor: SQLite cursor
+    :param ticker: String ticker symbol (e.g. AAPL)
+    :param timeframe: Optional timeframe label of a rollup table, None for the minute bars
+    :param session: Optional (start, end) HHMM session tuple
+    :return: Set of integer dates
+    """
+    sql, bounds = query.buildQuery(session, 'DISTINCT Date', timeframe)
+    return set(row[0] for row in cursor.execute(sql, (ticker, 0, 99999999) + bounds))
+
+
+def update(connection, names=TIMEFRAMES, tickers=None, changed=()):
+    """
+    Builds or extends the rollup tables from the regular session minute bars.
+    For every ticker the days of the rollup tables are compared with the
+    days of 'Algo_Trading', so days that are missing, including days
+    ingested after later ones, are rolled up and days that are gone are
+    removed. The last rolled up day, which may have been partly ingested,
+    and the 'changed' days are rebuilt. Only these days are read from
+    'Algo_Trading'
+    :param connection: SQLite connection
+    :param names: Timeframe labels to update (defaults to every timeframe)
+    :param tickers: Optional list of ticker symbols (defaults to every ticker)
+    :param changed: Optional collection of integer dates whose minute bars
+    were loaded or replaced (e.g. from 'database.ingest')
+    :return: Number of rolled up rows written
+    """
+    names = list(names)
+    createTables(connection, names)
+    cursor = connection.cursor()
+    if tickers is None:
+        tickers = [row[0] for row in cursor.execute('SELECT DISTINCT Ticker FROM ' + query.TABLE)]
+
+    written = 0
+    for ticker in tickers:
+        source = days(cursor, ticker, session=SESSION)
+        rebuild = {}
+        for name in names:
+            rolled = days(cursor, ticker, name)
+            rebuild[name] = (source ^ rolled) | (source & (set(changed) | {max(rolled, default=0)}))
+        if not any(rebuild.values()):
+            continue
+
+        needed = set().union(*rebuild.values()) & source
+        if needed:
+            data = query.readArrays(ticker, min(needed), max(needed), cursor, SESSION)
+            del data['Ticker']
+            order = numpy.lexsort((data['TimeBarStart'], data['Date']))
+            data = {column: values[order] for column, values in data.items()}
+
+        for name in names:
+            if not rebuild[name]:
+                continue
+            table = query.tableName(name)
+            # Days that are no longer in 'Algo_Trading' are only deleted
+            connection.executemany('DELETE FROM ' + table + ' WHERE Ticker=? AND Date=?',
+                                   [(ticker, date) for date in sorted(rebuild[name])])
+            keep = numpy.isin(data['Date'], list(rebuild[name] & source)) if needed else None
+            if keep is None or not keep.any():
+                continue
+            bars = rows(ticker, aggregate({column: values[keep] for column, values in data.items()},
+                                          TIMEFRAMES[name]))
+            connection.executemany('INSERT INTO ' + table + ' VALUES (?,?,?,?,?,?,?,?,?,?)', bars)
+            written += len(bars)
+        connection.commit()
+    return written
@@ -0,0 +1,209 @@
+# Walk-Forward File
+
+# This python file runs a walk-forward analysis of the financial
+# thesis. The date range is split into rolling train and test
+# windows, the best configuration of each train window is chosen
+# from a parameter space and then traded on the following test
+# window, so every reported result is out of sample
+
+# Imports
+import argparse
+import itertools
+import multiprocessing
+import numpy as numpy
+import pandas as pandas
+import backtest as backtest
+import query as query
+import datasource as datasource
+import cache as cache
+import sweep as sweep
+import fills as fills
+
+# Indicator periods of a configuration, configurations sharing them share their indicator columns
+PERIODS = ['sma_fast', 'sma_slow', 'ema', 'macd_fast', 'macd_slow', 'rsi_period']
+
+# Result columns of every train and test window
+RESULTS = sweep.RESULTS
+
+# Result columns where a lower value is better, these objectives are minimized
+MINIMIZED = ['lost', 'costs', 'drawdown']
+
+
+def windows(dates, train, test, step=None):
+    """
+    Splits the trading days of the data into rolling windows
+    :param dates: NumPy array of the 'Date' column in date order
+    :param train: Number of trading days in a train window
+    :param test: Number of trading days in a test window
+    :param step: Number of trading days between windows (defaults to 'test')
+    :return: List of (train start row, train stop row, test start row,
+    test stop row) tuples, stop rows are exclusive
+    """
+    days = numpy.unique(dates)
+    bounds = numpy.searchsorted(dates, days).tolist() + [len(dates)]
+    return [(bounds[first], bounds[first + train], bounds[first + train], bounds[first + train + test])
+            for first in range(0, len(days) - train - test + 1, step or test)]
+
+
+def evaluate(template, capital, config, start, stop):
+    """
+    Backtests one configuration on rows of a template backtest whose
+    indicator columns were filled over the full date range
+    :param template: 'Backtest' object after 'fillTable'
+    :param capital: Integer Amount of capital used in back testing the thesis
+    :param config: Configuration dictionary (see 'sweep.DEFAULTS')
+    :param start: First row of the window
+    :param stop: Row after the last row of the window
+    :return: Dictionary of the 'RESULTS' values
+    """
+    test = backtest.Backtest([], query.COLUMNS, capital, config['stop_loss'], config['percentage'],
+                             100, config['confirmation'])
+    test.df = template.df
+    test.sma_fast, test.sma_slow, test.ema_fast = template.sma_fast, template.sma_slow, template.ema_fast
+    test.vectorIterate(start, stop)
+    model = fills.fromConfig(config)
+    if model is not None:
+        test.applyFills(model)
+
+    result = test.ledger.summary(capital, stop - start)
+    for name in ['total_profit', 'won', 'lost', 'trades', 'costs']:
+        result[name] = getattr(test, name)
+    return result
+
+
+def _split(items, pieces):
+    """
+    Splits a list into contiguous chunks of nearly equal length
+    :param items: List to split
+    :param pieces: Largest number of chunks
+    :return: List of lists
+    """
+    size = -(-len(items) // pieces)
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+def _work(capital, key, timeframe, spans, configs):
+    """
+    Evaluates configurations that share their indicator periods on
+    train and test windows. The indicators are computed once over the full
+    date range and every window reads its slice of them
+    :param capital: Integer Amount of capital used in back testing the thesis
+    :param key: Optional (ticker, start, end) tuple of the data
+    :param timeframe: Optional 'timeframes.py' label of the bars in the data
+    :param spans: List of window tuples from 'windows'
+    :param configs: List of configuration dictionaries with the same 'PERIODS'
+    :return: List of (train results, test results) tuples, one list of
+    result dictionaries per window for every configuration
+    """
+    template = backtest.Backtest(sweep.sharedData(), query.COLUMNS, capital, 0.0, 0.0, 100, key=key, timeframe=timeframe,
+                                 lean=True)
+    template.fillTable(*(configs[0][name] for name in PERIODS), cache=cache.CACHE)
+    return [([evaluate(template, capital, config, train_start, train_stop)
+              for train_start, train_stop, test_start, test_stop in spans],
+             [evaluate(template, capital, config, test_start, test_stop)
+              for train_start, train_stop, test_start, test_stop in spans])
+            for config in configs]
+
+
+def walkForward(data, capital, configs, train, test, step=None, objective='total_profit', workers=None,
+                key=None, timeframe=None):
+    """
+    Runs the walk-forward analysis on a process pool. Configurations are
+    grouped by their indicator periods so a task computes the indicators
+    once for all of its configurations and windows. Groups are split by
+    configurations and then by windows until there are a few tasks per
+    worker, so a space that only varies 'stop_loss', 'percentage' or
+    'confirmation' still runs in parallel. The bar data is shared with
+    the workers by 'sweep.sharedPool'
+    :param data: Dictionary of column arrays (e.g. from 'query.readArrays')
+    :param capital: Integer Amount of capital used in back testing the thesis
+    :param configs: List of configuration dictionaries (see 'sweep.grid')
+    :param train: Number of trading days in a train window
+    :param test: Number of trading days in a test window
+    :param step: Number of trading days between windows (defaults to 'test')
+    :param objective: 'RESULTS' column maximized on the train windows, or
+    minimized when it is one of 'MINIMIZED'
+    :param workers: Number of worker processes (defaults to the CPU count)
+    :param key: Optional (ticker, start, end) tuple of the data, which turns
+    on the indicator cache of each worker
+    :param timeframe: Optional 'timeframes.py' label of the bars in the data
+    :return: Pandas DataFrame with one row per window of its dates, the chosen
+    configuration, its train objective and its test 'RESULTS'
+    """
+    if objective not in RESULTS:
+        raise ValueError("Unknown objective: " + objective)
+    spans = windows(data['Date'], train, test, step)
+    if not spans:
+        raise ValueError("The date range is shorter than one train and test window")
+
+    groups = {}
+    for config in configs:
+        groups.setdefault(tuple(config[name] for name in PERIODS), []).append(config)
+    groups = list(groups.values())
+    configs = [config for group in groups for config in group]
+
+    # Tasks of (first configuration number, configurations, windows)
+    pieces = -(-4 * (workers or multiprocessing.cpu_count()) // len(groups))
+    tasks = []
+    first = 0
+    for group in groups:
+        chunks = _split(group, min(len(group), pieces))
+        for chunk in chunks:
+            for part in _split(spans, min(len(spans), -(-pieces // len(chunks)))):
+                tasks.append((first, chunk, part))
+            first += len(chunk)
+
+    outcomes = [([], []) for config in configs]
+    with sweep.sharedPool(data, workers) as pool:
+        results = pool.map(_work, itertools.repeat(capital), itertools.repeat(key), itertools.repeat(timeframe),
+                           [part for first, chunk, part in tasks], [chunk for first, chunk, part in tasks])
+        # Windows of a configuration come back in order, one part per task
+        for (first, chunk, part), result in zip(tasks, results):
+            for (train_results, test_results), (train_part, test_part) in zip(outcomes[first:], result):
+                train_results.extend(train_part)
+                test_results.extend(test_part)
+
+    rows = []
+    for number, (train_start, train_stop, test_start, test_stop) in enumerate(spans):
+        scores = [train_results[number][objective] for train_results, test_results in outcomes]
+        best = int(numpy.argmin(scores) if objective in MINIMIZED else numpy.argmax(scores))
+        row = {'train_start': int(data['Date'][train_start]), 'train_end': int(data['Date'][train_stop - 1]),
+               'test_start': int(data['Date'][test_start]), 'test_end': int(data['Date'][test_stop - 1]),
+               'train_' + objective: scores[best]}
+        row.update(configs[best])
+        row.update(outcomes[best][1][number])
+        rows.append(row)
+    columns = (['train_start', 'train_end', 'test_start', 'test_end'] + list(sweep.DEFAULTS) +
+               ['train_' + objective] + RESULTS)
+    return pandas.DataFrame(rows, columns=columns)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Walk-forward analysis of the financial thesis for one ticker")
+    parser.add_argument('ticker', help="Ticker symbol (e.g. AAPL)")
+    parser.add_argument('start', type=int, help="Starting date (e.g. 20150102)")
+    parser.add_argument('end', type=int, help="Ending date (e.g. 20161230)")
+    parser.add_argument('settings', nargs='*', help="Parameter values, e.g. sma_fast=20,50 stop_loss=0.02,0.05")
+    parser.add_argument('--train', type=int, default=20, help="Trading days in a train window")
+    parser.add_argument('--test', type=int, default=5, help="Trading days in a test window")
+    parser.add_argument('--step', type=int, default=None, help="Trading days between windows (defaults to --test)")
+    parser.add_argument('--objective', default='total_profit', choices=RESULTS,
+                        help="Result maximized on the train windows (minimized for " + ", ".join(MINIMIZED) + ")")
+    parser.add_argument('--capital', type=int, default=1000000, help="Amount of capital for trades")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes")
+    parser.add_argument('--timeframe', default=None, help="Rollup bar timeframe (e.g. 15m) instead of minute bars")
+    parser.add_argument('--output', default=None, help="CSV file for the window results")
+    arguments = parser.parse_args()
+
+    with datasource.pool(immutable=True).acquire() as connection:
+        data = query.readArrays(arguments.ticker, arguments.start, arguments.end, connection.cursor(),
+                                timeframe=arguments.timeframe)
+
+    table = walkForward(data, arguments.capital, sweep.grid(sweep.parseSpace(arguments.settings)),
+                        arguments.train, arguments.test, arguments.step, arguments.objective,
+                        arguments.workers, (arguments.ticker, arguments.start, arguments.end), arguments.timeframe)
+    print(table.to_string())
+    print("Out of sample profit: " + str(round(float(table['total_profit'].sum()), 2)) +
+          " over " + str(len(table)) + " windows")
+    if arguments.output is not None:
+        table.to_csv(arguments.output, index=False)